@@ -27,17 +27,28 @@ CREATE TABLE IF NOT EXISTS products (
     brand_id INTEGER REFERENCES brands(id),
     category_id INTEGER REFERENCES categories(id),
     nutriscore_grade VARCHAR(1),
-    nova_group INTEGER,
-    quality_score INTEGER,
+    nova_group SMALLINT,
+    quality_score SMALLINT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
--- Index pour les colonnes filtrées
-CREATE INDEX IF NOT EXISTS idx_products_code ON products(code);
-CREATE INDEX IF NOT EXISTS idx_products_brand_id ON products(brand_id);
-CREATE INDEX IF NOT EXISTS idx_products_category_id ON products(category_id);
-CREATE INDEX IF NOT EXISTS idx_products_nutriscore ON products(nutriscore_grade);
-CREATE INDEX IF NOT EXISTS idx_products_quality ON products(quality_score);
+-- Index pour les colonnes filtrées (code est déjà indexé par sa contrainte UNIQUE)
+CREATE INDEX IF NOT EXISTS idx_brand ON products(brand_id);
+CREATE INDEX IF NOT EXISTS idx_cat_quality ON products(category_id, quality_score);
 
 -- Index composé pour requêtes fréquentes
 CREATE INDEX IF NOT EXISTS idx_nutriscore_quality ON products(nutriscore_grade, quality_score);
+
+-- Valeurs nutritionnelles pour 100g (1:1 avec products), en simple précision
+CREATE TABLE IF NOT EXISTS nutrition_facts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER NOT NULL UNIQUE REFERENCES products(id),
+    energy_kcal REAL,
+    fat REAL,
+    saturated_fat REAL,
+    carbohydrates REAL,
+    sugars REAL,
+    fiber REAL,
+    proteins REAL,
+    salt REAL
+);
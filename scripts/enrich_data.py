@@ -14,13 +14,19 @@ MongoDB (products_raw) → enricher.py → MongoDB (products_enriched)
 UTILISATION :
     python scripts/enrich_data.py
 
-Ce script lit tous les documents de products_raw, les enrichit un par un,
-et stocke les résultats dans products_enriched.
+Ce script lit les documents de products_raw en flux (curseur MongoDB), les
+enrichit par sous-lots vectorisés répartis sur un pool de processus (enrich_batch),
+et stocke les résultats dans products_enriched. L'écriture des lots se fait dans
+un thread dédié, alimenté par une file bornée (Queue(maxsize=2)) : l'enrichissement
+du lot suivant se poursuit pendant l'écriture du précédent.
 =============================================================================
 """
 
 import sys
+import threading
+from collections import Counter
 from pathlib import Path
+from queue import Queue
 
 from loguru import logger  # Librairie de logging avancée
 
@@ -38,40 +44,71 @@ def main():
     Fonction principale du script d'enrichissement.
     
     Étapes :
-    1. Se connecte à MongoDB
-    2. Récupère tous les documents RAW
-    3. Enrichit chaque document (calcul du score, catégorisation)
-    4. Sauvegarde les documents enrichis dans la collection ENRICHED
+    1. Se connecte à MongoDB et compte les documents RAW
+    2. Lit les documents RAW en flux (curseur) et les enrichit par sous-lots
+       vectorisés sur un pool de processus (enrich_batch)
+    3. Confie les lots enrichis (INSERT_BATCH_SIZE documents) à un thread d'écriture,
+       via une file bornée à 2 lots : la sauvegarde dans ENRICHED se fait pendant
+       l'enrichissement du lot suivant
     """
     # Import des modules nécessaires
-    from src.database.mongodb_manager import MongoDBManager
-    from src.enrichment.enricher import enrich_product
+    from src.database.mongodb_manager import MongoDBManager, INSERT_BATCH_SIZE
+    from src.enrichment.enricher import enrich_batch, utc_now_iso
     
     # Utiliser le context manager pour gérer la connexion MongoDB
     with MongoDBManager() as mongo:
-        # ÉTAPE 1 : Récupérer tous les documents bruts
-        raw_docs = mongo.get_raw_documents_for_enrichment()
-        logger.info(f"📥 {len(raw_docs)} documents RAW à enrichir")
+        # ÉTAPE 1 : Compter les documents bruts (ils sont ensuite lus en flux)
+        total = mongo.count_raw_documents()
+        logger.info(f"📥 {total} documents RAW à enrichir")
         
         # Vérifier qu'il y a des documents à traiter
-        if not raw_docs:
+        if not total:
             logger.warning("Aucun document à enrichir")
             return
         
         # Listes et compteurs pour le traitement
-        enriched_docs = []  # Documents enrichis à sauvegarder
-        stats = {"success": 0, "failed": 0}  # Statistiques
+        enriched_docs = []  # Documents enrichis en attente de sauvegarde
+        stats = Counter()  # Statistiques par statut (success / failed)
+        count = 0
+        # Horodatage commun à tout le lancement (au lieu d'un par document)
+        now_iso = utc_now_iso()
         
-        # ÉTAPE 2 : Enrichir chaque document
-        for raw_doc in raw_docs:
-            # Appeler la fonction d'enrichissement
-            enriched = enrich_product(raw_doc)
-            enriched_docs.append(enriched)
-            # Mettre à jour les statistiques selon le statut
-            stats[enriched["status"]] = stats.get(enriched["status"], 0) + 1
+        # ÉTAPE 3 (en parallèle) : un thread écrit les lots pendant que le suivant
+        # s'enrichit ; la file bornée à 2 lots limite la mémoire si MongoDB ralentit
+        pending = Queue(maxsize=2)
+        write_error = None
         
-        # ÉTAPE 3 : Sauvegarder tous les documents enrichis en batch
-        count = mongo.insert_enriched_documents_batch(enriched_docs)
+        def write_batches():
+            nonlocal count, write_error
+            while (batch := pending.get()) is not None:
+                # Après une erreur, continuer à vider la file pour ne pas bloquer l'enrichissement
+                if write_error is None:
+                    try:
+                        count += mongo.insert_enriched_documents_batch(batch)
+                    except Exception as e:
+                        write_error = e
+        
+        writer = threading.Thread(target=write_batches, daemon=True)
+        writer.start()
+        
+        # ÉTAPE 2 : Enrichir les documents au fil du curseur, répartis sur tous les cœurs
+        try:
+            for enriched in enrich_batch(mongo.iter_raw_documents_for_enrichment(), now_iso=now_iso):
+                enriched_docs.append(enriched)
+                # Mettre à jour les statistiques selon le statut
+                stats[enriched.status] += 1
+                
+                if len(enriched_docs) >= INSERT_BATCH_SIZE:
+                    pending.put(enriched_docs)
+                    enriched_docs = []
+            
+            pending.put(enriched_docs)
+        finally:
+            # Fin de flux : attendre l'écriture des derniers lots avant de fermer la connexion
+            pending.put(None)
+            writer.join()
+        if write_error is not None:
+            raise write_error
         
         # Afficher le résumé
         logger.info(f"✅ Success: {stats['success']} | ❌ Failed: {stats['failed']}")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+=============================================================================
+SCRIPT DE MIGRATION - RECALCUL DES HASH RAW
+=============================================================================
+Les documents de products_raw collectés avant le passage au hash actuel
+(empreinte BLAKE2b de 16 octets du payload réduit) portent un raw_hash
+SHA-256 hexadécimal calculé sur le payload complet. Une nouvelle collecte
+ne les reconnaîtrait pas comme doublons et les réinsérerait.
+
+Les documents de products_enriched plus anciens référencent leur document
+RAW par un raw_id chaîne : un nouvel enrichissement (raw_id ObjectId) ne les
+remplacerait pas et chaque produit aurait deux documents enrichis.
+
+Ce script convertit d'abord ces raw_id en ObjectId (en supprimant l'ancien
+document quand le nouveau existe déjà), puis réduit le payload des documents
+RAW, recalcule leur raw_hash et supprime les doublons ainsi révélés (avec
+leur document enrichi).
+
+UTILISATION (une fois, avant la prochaine collecte) :
+    python scripts/migrate_raw_hashes.py
+
+Sans effet sur une base déjà migrée.
+=============================================================================
+"""
+
+import sys
+from pathlib import Path
+
+from loguru import logger  # Librairie de logging avancée
+
+# Ajouter le chemin racine au path Python
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+# Configuration des logs avec format coloré
+logger.remove()
+logger.add(sys.stdout, format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>", level="INFO")
+
+
+def main():
+    """Convertit les raw_id de products_enriched, puis recalcule les raw_hash de products_raw."""
+    from src.database.mongodb_manager import MongoDBManager
+    
+    with MongoDBManager() as mongo:
+        raw_ids = mongo.migrate_enriched_raw_ids()
+        stats = mongo.rehash_raw_documents()
+    
+    logger.info(f"🔗 {raw_ids['converted']} raw_id ENRICHED convertis | 🗑️ {raw_ids['removed']} doublons supprimés")
+    logger.info(f"🔁 {stats['updated']} documents RAW migrés | 🗑️ {stats['removed']} doublons supprimés")
+
+
+if __name__ == "__main__":
+    main()
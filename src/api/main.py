@@ -1,14 +1,13 @@
 """API FastAPI pour exposer les données produits."""
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-
-import sys
-sys.path.insert(0, str(__file__).rsplit("src", 1)[0])
+from sqlalchemy import and_, func, or_
 
 from src.etl.models import get_session, Product, Brand, Category
 
@@ -47,6 +46,7 @@ class ItemListResponse(BaseModel):
     page: int
     page_size: int
     total_pages: int
+    next_cursor: Optional[str] = None
 
 
 class StatsResponse(BaseModel):
@@ -58,8 +58,19 @@ class StatsResponse(BaseModel):
 
 
 # App FastAPI
-app = FastAPI(title="Food Analytics API", version="1.0.0")
+# ORJSONResponse : encodage JSON en C (orjson) pour toutes les routes
+app = FastAPI(title="Food Analytics API", version="1.0.0", default_response_class=ORJSONResponse)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(GZipMiddleware, minimum_size=1000)  # Compresse les réponses volumineuses (/items)
+
+
+def _parse_cursor(cursor: str) -> Tuple[int, int]:
+    """Décode un curseur "score_id" (score qualité et id du dernier produit vu)."""
+    try:
+        score, last_id = cursor.split("_")
+        return int(score), int(last_id)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Curseur invalide")
 
 
 def get_db():
@@ -79,9 +90,20 @@ def get_items(
     brand: Optional[str] = None,
     nutriscore: Optional[str] = None,
     min_quality: Optional[int] = Query(None, ge=0, le=100),
+    include_ungraded: bool = False,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Liste paginée des produits avec filtres."""
+    """
+    Liste paginée des produits avec filtres.
+    
+    `nutriscore` accepte plusieurs grades séparés par des virgules (casse ignorée) ;
+    `include_ungraded` y ajoute les produits sans grade (comportement du dashboard).
+    Tri par score qualité décroissant puis par id. Sans `cursor` : pagination par OFFSET.
+    Avec `cursor` (le `next_cursor` de la page précédente) : pagination par curseur sur
+    (score, id), coût constant quelle que soit la profondeur ; `page` n'est alors
+    qu'indicatif. `next_cursor` vaut None sur la dernière page.
+    """
     query = db.query(Product)
     
     if search:
@@ -101,24 +123,46 @@ def get_items(
         query = query.filter(Brand.name.ilike(f"%{brand}%"))
     
     if nutriscore:
-        query = query.filter(Product.nutriscore_grade.ilike(nutriscore))
+        # Un ou plusieurs grades séparés par des virgules (ex: "a,b")
+        grades = [g.strip().lower() for g in nutriscore.split(",") if g.strip()]
+        condition = func.lower(Product.nutriscore_grade).in_(grades)
+        if include_ungraded:
+            condition = or_(condition, Product.nutriscore_grade.is_(None), Product.nutriscore_grade == "")
+        query = query.filter(condition)
     
     if min_quality is not None:
         query = query.filter(Product.quality_score >= min_quality)
     
     total = query.count()
     total_pages = (total + page_size - 1) // page_size
-    products = query.order_by(Product.quality_score.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    # Score sans NULL (-1 : en fin de liste) et id en second critère : ordre total,
+    # identique en OFFSET et par curseur
+    score = func.coalesce(Product.quality_score, -1)
+    query = query.order_by(score.desc(), Product.id)
+    if cursor:
+        last_score, last_id = _parse_cursor(cursor)
+        query = query.filter(or_(score < last_score, and_(score == last_score, Product.id > last_id)))
+    else:
+        query = query.offset((page - 1) * page_size)
+    # Une ligne de plus que la page : indique s'il reste une page suivante
+    products = query.limit(page_size + 1).all()
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        last = products[-1]
+        next_cursor = f"{last.quality_score if last.quality_score is not None else -1}_{last.id}"
     
-    return ItemListResponse(
-        items=[ItemSummary(
-            id=p.id, code=p.code, product_name=p.product_name,
-            brand=p.brand.name if p.brand else None,
-            category=p.category.name if p.category else None,
-            nutriscore_grade=p.nutriscore_grade, quality_score=p.quality_score, image_url=p.image_url
-        ) for p in products],
-        total=total, page=page, page_size=page_size, total_pages=total_pages
-    )
+    # Réponse déjà au format ItemListResponse : renvoyée telle quelle, sans re-validation
+    # pydantic ligne par ligne (response_model reste la référence pour la documentation)
+    return ORJSONResponse({
+        "items": [{
+            "id": p.id, "code": p.code, "product_name": p.product_name,
+            "brand": p.brand.name if p.brand else None,
+            "category": p.category.name if p.category else None,
+            "nutriscore_grade": p.nutriscore_grade, "quality_score": p.quality_score, "image_url": p.image_url
+        } for p in products],
+        "total": total, "page": page, "page_size": page_size, "total_pages": total_pages, "next_cursor": next_cursor
+    })
 
 
 @app.get("/items/{item_id}", response_model=ItemDetail)
@@ -151,13 +195,15 @@ def get_stats(db: Session = Depends(get_db)):
     """Statistiques globales."""
     nutri_dist = {grade: db.query(Product).filter(Product.nutriscore_grade == grade).count() for grade in ['a', 'b', 'c', 'd', 'e']}
     
-    return StatsResponse(
-        total_products=db.query(Product).count(),
-        total_brands=db.query(Brand).count(),
-        total_categories=db.query(Category).count(),
-        avg_quality_score=db.query(func.avg(Product.quality_score)).scalar(),
-        nutriscore_distribution=nutri_dist
-    )
+    avg_quality_score = db.query(func.avg(Product.quality_score)).scalar()
+    # Format StatsResponse renvoyé tel quel (AVG PostgreSQL = Decimal : converti pour orjson)
+    return ORJSONResponse({
+        "total_products": db.query(Product).count(),
+        "total_brands": db.query(Brand).count(),
+        "total_categories": db.query(Category).count(),
+        "avg_quality_score": float(avg_quality_score) if avg_quality_score is not None else None,
+        "nutriscore_distribution": nutri_dist
+    })
 
 
 @app.get("/categories", response_model=List[str])
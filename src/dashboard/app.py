@@ -1,14 +1,21 @@
 """Dashboard Streamlit - Food Analytics"""
 
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, NamedTuple, Tuple
+from urllib.parse import urlencode
+
+import orjson
 import streamlit as st
 import requests
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Configuration
 st.set_page_config(page_title="Food Analytics", page_icon="🥗", layout="wide", initial_sidebar_state="expanded")
 API_URL = "http://localhost:8000"
 
 # CSS - Thème professionnel sombre
-st.markdown("""
+CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
     
@@ -103,6 +110,18 @@ st.markdown("""
         transition: all 0.2s ease;
     }
     .nutri-dist-item:hover { box-shadow: 0 2px 8px rgba(0,0,0,0.2); }
+    
+    .product-link { text-decoration: none !important; color: inherit !important; display: block; }
+    .product-card {
+        background: var(--bg-card);
+        border: 1px solid var(--border);
+        border-radius: 12px;
+        padding: 1rem;
+        height: 100%;
+        transition: all 0.2s ease;
+        box-shadow: 0 1px 3px rgba(0,0,0,0.2);
+    }
+    .product-link:hover .product-card { box-shadow: 0 4px 12px rgba(0,0,0,0.3); transform: translateY(-2px); }
     .nutri-dist-count { font-size: 1.3rem; font-weight: 600; color: var(--text-primary); margin-top: 0.4rem; }
     
     .section-header {
@@ -144,6 +163,13 @@ st.markdown("""
         background: var(--accent-light) !important;
         box-shadow: 0 2px 8px rgba(59, 130, 246, 0.3) !important;
     }
+    .pager-link {
+        display: block; text-align: center; text-decoration: none !important;
+        background: var(--accent); color: white !important;
+        border-radius: 8px; font-weight: 500; padding: 0.6rem 1rem; transition: all 0.2s ease;
+    }
+    .pager-link:hover { background: var(--accent-light); box-shadow: 0 2px 8px rgba(59, 130, 246, 0.3); }
+    .pager-link.disabled { opacity: 0.4; pointer-events: none; }
             
     .stMarkdown, p {color:#ffffff !important;}
     
@@ -167,43 +193,235 @@ st.markdown("""
     
     hr { border-color: var(--border) !important; }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def _css_payload() -> str:
+    """CSS compacté une seule fois par processus (espaces superflus supprimés)."""
+    return " ".join(CSS.split())
+
+
+def inject_css():
+    """Injecte le thème. Streamlit efface tout élément non ré-émis, d'où l'appel à chaque rerun."""
+    st.markdown(_css_payload(), unsafe_allow_html=True)
+
+
+# Tables de couleurs précalculées (au lieu de dicts reconstruits à chaque carte)
+NUTRI_COLORS = {'a': '#059669', 'b': '#84cc16', 'c': '#eab308', 'd': '#f97316', 'e': '#dc2626'}
+NUTRI_UNKNOWN_COLOR = '#9ca3af'
+NUTRI_TEXT = {'c': '#1f2937'}  # Texte sombre sur le badge jaune
+QCOLOR = tuple('#10b981' if q >= 70 else '#f59e0b' if q >= 40 else '#ef4444' for q in range(101))
+NOVA_LABELS = {1: "Non transformé", 2: "Ingrédients culinaires", 3: "Aliments transformés", 4: "Ultra-transformés"}
+NOVA_COLORS = {1: "#059669", 2: "#84cc16", 3: "#f97316", 4: "#dc2626"}
+
+# Templates HTML des cartes du tableau de bord (rendues en une seule grille CSS)
+STATCARDS_TPL = '<div style="display:grid; grid-template-columns:repeat({cols}, 1fr); gap:1rem;">{cards}</div>'
+_STAT_TPL = '<div class="stat-card"><div class="stat-icon">{icon}</div><div class="stat-value">{value}</div><div class="stat-label">{label}</div><div class="stat-desc">{desc}</div></div>'
+_NUTRI_DIST_TPL = '<div class="nutri-dist-item"><div class="nutri-badge nutri-{grade}" style="margin:0 auto 0.5rem auto;">{grade_upper}</div><div class="nutri-dist-count">{count}</div></div>'
 
 
-def api_get(endpoint: str, params: dict = None):
-    """Requête GET vers l'API."""
+# Carte produit de la grille (un seul template, rempli depuis un CardView).
+# Navigation par simple lien, survol géré en CSS : aucun widget ni JavaScript par carte
+CARD_TMPL = (
+    '<a href="?{qs}product_id={c.id}" target="_self" class="product-link"><div class="product-card">'
+    '<div style="width:100%; height:140px; background:#111827; border-radius:8px; display:flex; align-items:center; justify-content:center; overflow:hidden; margin-bottom:0.8rem;">{c.img_html}</div>'
+    '<div style="color:#f9fafb; font-weight:500; font-size:0.9rem; min-height:2.4em; line-height:1.2; margin-bottom:0.3rem;">{c.name}</div>'
+    '<div style="color:#6b7280; font-size:0.7rem; text-transform:uppercase; letter-spacing:0.3px; margin-bottom:0.8rem;">{c.brand}</div>'
+    '<div style="display:flex; justify-content:space-between; align-items:center; padding-top:0.8rem; border-top:1px solid #374151;">'
+    '<div style="background:{c.nutri_color}; width:28px; height:28px; border-radius:6px; display:flex; align-items:center; justify-content:center; font-weight:600; font-size:0.8rem; color:{c.nutri_text_color};">{c.nutri_letter}</div>'
+    '<div style="text-align:right;"><div style="color:{c.quality_color}; font-weight:600; font-size:0.95rem;">{c.quality}</div><div style="color:#6b7280; font-size:0.6rem;">/100</div></div>'
+    '</div></div></a>'
+)
+# Images chargées à la demande, dimensions fixes pour éviter les décalages de mise en page
+CARD_IMG_TMPL = '<img src="{}" loading="lazy" decoding="async" fetchpriority="low" width="120" height="120" style="max-width:90%; max-height:120px; object-fit:contain;" />'
+CARD_NO_IMG = '<div style="font-size:3rem; color:#4b5563;">📦</div>'
+
+
+class CardView(NamedTuple):
+    """Valeurs d'affichage d'une carte, calculées en une passe sur le produit."""
+    id: int
+    img_html: str
+    name: str
+    brand: str
+    nutri_color: str
+    nutri_text_color: str
+    nutri_letter: str
+    quality: int
+    quality_color: str
+
+
+def _card_view(item: dict) -> CardView:
+    """Prépare les champs d'affichage d'un produit de /items (troncature, couleurs, image)."""
+    name = item['product_name']
+    nutri = item.get('nutriscore_grade') or ''
+    quality = item.get('quality_score') or 0
+    img_url = item.get('image_url')
+    return CardView(
+        item['id'],
+        CARD_IMG_TMPL.format(img_url) if img_url else CARD_NO_IMG,
+        name if len(name) <= 30 else name[:30] + '...',
+        item.get('brand') or 'Marque inconnue',
+        NUTRI_COLORS.get(nutri.lower(), NUTRI_UNKNOWN_COLOR),
+        NUTRI_TEXT.get(nutri, '#fff'),
+        nutri.upper() or '?',
+        quality,
+        QCOLOR[min(quality, 100)],
+    )
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Session HTTP partagée entre les reruns (connexions Keep-Alive réutilisées)."""
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                          max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]))
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers.update({"Accept-Encoding": "gzip", "Accept": "application/json"})
+    return s
+
+
+def api_get(endpoint: str, params: dict = None) -> Tuple[bool, Any]:
+    """
+    Requête GET vers l'API.
+    
+    Returns:
+        (True, données JSON) en cas de succès,
+        (False, code HTTP) si l'API répond une erreur (ex: 404),
+        (False, None) si l'API est injoignable ou la réponse illisible.
+    Les erreurs 502/503/504 transitoires sont déjà réessayées par la session.
+    """
     try:
-        r = requests.get(f"{API_URL}{endpoint}", params=params, timeout=10)
+        r = get_session().get(f"{API_URL}{endpoint}", params=params, timeout=10)
         r.raise_for_status()
-        return r.json()
-    except:
-        return None
+        return True, orjson.loads(r.content)
+    except requests.HTTPError as e:
+        return False, e.response.status_code
+    except (requests.RequestException, orjson.JSONDecodeError):
+        return False, None
+
+
+def api_get_many(*calls):
+    """Exécute plusieurs appels API indépendants en parallèle et renvoie leurs résultats dans l'ordre."""
+    # Les threads héritent du contexte Streamlit pour pouvoir utiliser les fonctions en cache
+    with ThreadPoolExecutor(max_workers=4, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())) as ex:
+        return [f.result() for f in [ex.submit(call) for call in calls]]
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_stats():
+    """Statistiques globales, mises en cache 60 s entre les reruns."""
+    return api_get("/stats")
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_categories():
+    """Liste des catégories, mise en cache 5 min entre les reruns."""
+    return api_get("/categories")
+
+
+@st.cache_data(ttl=30, max_entries=64, show_spinner=False)
+def cached_items(cursor: str, page: int, page_size: int, search: str = "", category: str = "Toutes", nutriscore: str = ""):
+    """Page de produits (pagination par curseur), mise en cache 30 s (une entrée par combinaison de filtres)."""
+    params = {"page": page, "page_size": page_size}
+    if cursor:
+        params["cursor"] = cursor
+    if search:
+        params["search"] = search
+    if category != "Toutes":
+        params["category"] = category
+    if nutriscore:
+        # Les produits sans Nutriscore restent affichés quel que soit le filtre
+        params["nutriscore"] = nutriscore
+        params["include_ungraded"] = "true"
+    return api_get("/items", params)
+
+
+@st.cache_data(ttl=120, max_entries=256, show_spinner=False)
+def cached_detail(product_id: int):
+    """Détail d'un produit, mis en cache 2 min."""
+    return api_get(f"/items/{product_id}")
+
+
+LIST_PARAMS = ("search", "category", "nutri", "cursors")
+CURSOR_RE = re.compile(r"-?\d+_\d+")
+
+
+def set_query_param(key: str, value: str):
+    """Écrit un paramètre d'URL, ou le retire si la valeur est vide."""
+    if value:
+        st.query_params[key] = value
+    elif key in st.query_params:
+        del st.query_params[key]
+
+
+def cursor_stack() -> List[str]:
+    """Curseurs ("score_id" du dernier produit vu) des pages précédentes, lus depuis ?cursors=87_12.72_60"""
+    return [c for c in st.query_params.get("cursors", "").split(".") if CURSOR_RE.fullmatch(c)]
+
+
+def list_query(cursors: List[str]) -> str:
+    """Query string de la liste (filtres courants) pour la pile de curseurs donnée."""
+    params = {"view": "produits"}
+    params.update({k: st.query_params[k] for k in LIST_PARAMS[:-1] if k in st.query_params})
+    if cursors:
+        params["cursors"] = ".".join(cursors)
+    return urlencode(params)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def nutri_dist_html(dist: tuple) -> str:
+    """Grille HTML de la répartition Nutriscore, mémoïsée sur les couples (grade, effectif)."""
+    cards = "".join(_NUTRI_DIST_TPL.format(grade=grade, grade_upper=grade.upper(), count=count) for grade, count in dist)
+    return STATCARDS_TPL.format(cols=5, cards=cards)
 
 
 # Vérification API
-stats = api_get("/stats")
-if not stats:
+ok, stats = cached_stats()
+if not ok:
+    cached_stats.clear()  # Ne pas garder l'échec en cache : réessayer au prochain rerun
     st.error("API non disponible. Lancez: python -m uvicorn src.api.main:app --reload")
     st.stop()
 
+# Le thème n'est injecté qu'une fois l'API joignable : la page d'erreur reste instantanée
+inject_css()
+
 # Session state
-if 'current_page' not in st.session_state:
-    st.session_state.current_page = 1
+# Les filtres et la page de la liste vivent dans l'URL (?search=...&category=...&nutri=...&cursors=...) :
+# l'URL est partageable et une nouvelle session (lien de carte, pagination) repart du bon état
 if 'selected_product_id' not in st.session_state:
     st.session_state.selected_product_id = None
-for key in ['product_search', 'category_filter']:
-    if key not in st.session_state:
-        st.session_state[key] = "" if key == 'product_search' else "Toutes"
+if 'product_search' not in st.session_state:
+    st.session_state.product_search = st.query_params.get("search", "")
+if 'category_filter' not in st.session_state:
+    st.session_state.category_filter = st.query_params.get("category", "Toutes")
+if 'page_mode' not in st.session_state and st.query_params.get("view") == "produits":
+    st.session_state.page_mode = "Produits"
+url_nutri = st.query_params.get("nutri")
 for grade in ['a', 'b', 'c', 'd', 'e']:
     if f'nutri_{grade}' not in st.session_state:
-        st.session_state[f'nutri_{grade}'] = True
+        st.session_state[f'nutri_{grade}'] = url_nutri is None or grade in url_nutri
+
+# Navigation par URL : un clic sur une carte produit recharge la page avec ?product_id=...
+# Le paramètre est consommé aussitôt pour ne pas forcer la page produit aux reruns suivants
+product_id_param = st.query_params.get("product_id")
+if product_id_param is not None:
+    if product_id_param.isdigit():
+        st.session_state.selected_product_id = int(product_id_param)
+        st.session_state.page_mode = "Produits"
+    del st.query_params["product_id"]
 
 # Sidebar
 with st.sidebar:
     st.markdown("### 🥗 Food Analytics")
     st.caption("Base de données alimentaires")
     st.divider()
-    page_mode = st.radio("Navigation", ["Tableau de bord", "Produits"], label_visibility="collapsed")
+    page_mode = st.radio("Navigation", ["Tableau de bord", "Produits"], label_visibility="collapsed", key="page_mode",
+                         on_change=lambda: set_query_param("view", "produits" if st.session_state.page_mode == "Produits" else ""))
     st.divider()
     st.caption("Données: Open Food Facts")
 
@@ -212,24 +430,20 @@ with st.sidebar:
 if page_mode == "Tableau de bord":
     st.markdown('<div class="section-header"><strong>📊 Tableau de bord</strong></div>', unsafe_allow_html=True)
     
-    col1, col2, col3, col4 = st.columns(4)
-    for col, icon, value, label, desc in [
-        (col1, "📦", stats["total_products"], "Produits", "Produits référencés"),
-        (col2, "🏭", stats["total_brands"], "Marques", "Marques différentes"),
-        (col3, "🗂️", stats["total_categories"], "Catégories", "Types de produits"),
-        (col4, "⭐", f'{(stats["avg_quality_score"] or 0):.0f}', "Score moyen", "Qualité moyenne"),
-    ]:
-        with col:
-            st.markdown(f'<div class="stat-card"><div class="stat-icon">{icon}</div><div class="stat-value">{value}</div><div class="stat-label">{label}</div><div class="stat-desc">{desc}</div></div>', unsafe_allow_html=True)
+    # Une seule grille CSS au lieu de st.columns(4) : 1 élément Streamlit au lieu de 8
+    cards = "".join(_STAT_TPL.format(icon=icon, value=value, label=label, desc=desc) for icon, value, label, desc in [
+        ("📦", stats["total_products"], "Produits", "Produits référencés"),
+        ("🏭", stats["total_brands"], "Marques", "Marques différentes"),
+        ("🗂️", stats["total_categories"], "Catégories", "Types de produits"),
+        ("⭐", f'{(stats["avg_quality_score"] or 0):.0f}', "Score moyen", "Qualité moyenne"),
+    ])
+    st.markdown(STATCARDS_TPL.format(cols=4, cards=cards), unsafe_allow_html=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     st.markdown('<div class="section-header"><strong>🏷️ Répartition Nutriscore</strong></div>', unsafe_allow_html=True)
     
     dist = stats.get("nutriscore_distribution", {})
-    cols = st.columns(5)
-    for i, (grade, color) in enumerate([("A", "#059669"), ("B", "#84cc16"), ("C", "#eab308"), ("D", "#f97316"), ("E", "#dc2626")]):
-        with cols[i]:
-            st.markdown(f'<div class="nutri-dist-item"><div class="nutri-badge nutri-{grade.lower()}" style="margin:0 auto 0.5rem auto;">{grade}</div><div class="nutri-dist-count">{dist.get(grade.lower(), 0)}</div></div>', unsafe_allow_html=True)
+    st.markdown(nutri_dist_html(tuple((g, dist.get(g, 0)) for g in "abcde")), unsafe_allow_html=True)
 
 
 # Page: Produits
@@ -241,9 +455,13 @@ elif page_mode == "Produits":
             st.session_state.selected_product_id = None
             st.rerun()
         
-        detail = api_get(f"/items/{st.session_state.selected_product_id}")
-        if not detail:
-            st.error("Produit non trouvé")
+        ok, detail = cached_detail(st.session_state.selected_product_id)
+        if not ok:
+            if detail == 404:
+                st.error("Produit non trouvé")
+            else:
+                cached_detail.clear()  # Erreur transitoire : ne pas la garder en cache
+                st.error("Impossible de charger le produit, réessayez dans un instant")
             st.stop()
         
         nutriscore = detail.get('nutriscore_grade', '')
@@ -251,8 +469,7 @@ elif page_mode == "Produits":
         nova = detail.get('nova_group')
         brand = detail.get('brand') or 'Marque inconnue'
         category = detail.get('category') or 'Non catégorisé'
-        nutri_colors = {'a': '#059669', 'b': '#84cc16', 'c': '#eab308', 'd': '#f97316', 'e': '#dc2626'}
-        nutri_bg = nutri_colors.get(nutriscore.lower(), '#9ca3af') if nutriscore else '#9ca3af'
+        nutri_bg = NUTRI_COLORS.get((nutriscore or '').lower(), NUTRI_UNKNOWN_COLOR)
         
         # Hero Section
         st.markdown(f'''
@@ -260,7 +477,7 @@ elif page_mode == "Produits":
             <div style="display: flex; gap: 2rem; align-items: flex-start; flex-wrap: wrap;">
                 <div style="flex: 0 0 260px; display: flex; flex-direction: column; align-items: center;">
                     <div style="width: 240px; height: 240px; background: #111827; border-radius: 12px; display: flex; align-items: center; justify-content: center; border: 1px solid #374151;">
-                        {f'<img src="{detail.get("image_url")}" style="max-width: 90%; max-height: 90%; object-fit: contain;" />' if detail.get('image_url') else '<span style="font-size: 4rem; color: #4b5563;">📦</span>'}
+                        {f'<img src="{detail.get("image_url")}" decoding="async" fetchpriority="high" width="216" height="216" style="max-width: 90%; max-height: 90%; object-fit: contain;" />' if detail.get('image_url') else '<span style="font-size: 4rem; color: #4b5563;">📦</span>'}
                     </div>
                     <div style="margin-top: 1rem; background: #374151; border-radius: 8px; padding: 0.5rem 1rem; text-align: center;">
                         <span style="color: #9ca3af; font-size: 0.75rem;">🏷️ {category}</span>
@@ -270,7 +487,7 @@ elif page_mode == "Produits":
                     <h1 style="color: #f9fafb; font-size: 1.6rem; margin: 0 0 0.5rem 0; font-weight: 600;">{detail["product_name"]}</h1>
                     <p style="color: #9ca3af; text-transform: uppercase; letter-spacing: 1px; font-size: 0.8rem; margin-bottom: 1.5rem;">{brand}</p>
                     <div style="display: flex; gap: 1rem; flex-wrap: wrap;">
-                        <div style="background: {nutri_bg}; color: {'#1f2937' if nutriscore == 'c' else 'white'}; padding: 1rem 1.5rem; border-radius: 12px; text-align: center; min-width: 100px;">
+                        <div style="background: {nutri_bg}; color: {NUTRI_TEXT.get(nutriscore, 'white')}; padding: 1rem 1.5rem; border-radius: 12px; text-align: center; min-width: 100px;">
                             <div style="font-size: 2rem; font-weight: 700;">{nutriscore.upper() if nutriscore else '?'}</div>
                             <div style="font-size: 0.65rem; letter-spacing: 1px; opacity: 0.9;">NUTRISCORE</div>
                         </div>
@@ -289,45 +506,64 @@ elif page_mode == "Produits":
         ''', unsafe_allow_html=True)
         
         # Info Cards
-        nova_labels = {1: "Non transformé", 2: "Ingrédients culinaires", 3: "Aliments transformés", 4: "Ultra-transformés"}
-        nova_colors = {1: "#059669", 2: "#84cc16", 3: "#f97316", 4: "#dc2626"}
-        progress_color = "#10b981" if quality >= 70 else "#f59e0b" if quality >= 40 else "#ef4444"
+        progress_color = QCOLOR[min(quality, 100)]
         
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown(f'''
-            <div style="background: #1f2937; border: 1px solid #374151; border-radius: 12px; padding: 1.5rem; text-align: center; box-shadow: 0 1px 3px rgba(0,0,0,0.2);">
-                <div style="color: #9ca3af; font-size: 0.7rem; text-transform: uppercase; letter-spacing: 1px;">Groupe NOVA</div>
-                <div style="color: {nova_colors.get(nova, '#6b7280')}; font-size: 2.5rem; font-weight: 700; margin: 0.5rem 0;">{nova if nova else '?'}</div>
-                <div style="color: #f9fafb; font-size: 0.85rem;">{nova_labels.get(nova, 'Non disponible')}</div>
-            </div>
-            ''', unsafe_allow_html=True)
-        with col2:
-            st.markdown(f'''
-            <div style="background: #1f2937; border: 1px solid #374151; border-radius: 12px; padding: 1.5rem; text-align: center; box-shadow: 0 1px 3px rgba(0,0,0,0.2);">
-                <div style="color: #9ca3af; font-size: 0.7rem; text-transform: uppercase; letter-spacing: 1px;">Score Qualité</div>
-                <div style="background: #374151; border-radius: 6px; height: 8px; overflow: hidden; margin: 1rem 0;">
-                    <div style="background: {progress_color}; width: {quality}%; height: 100%; border-radius: 6px;"></div>
-                </div>
-                <div style="color: #f9fafb; font-size: 1.5rem; font-weight: 600;">{quality}<span style="color: #6b7280; font-size: 0.9rem;">/100</span></div>
-            </div>
-            ''', unsafe_allow_html=True)
+        # Les deux cartes dans une seule grille CSS (un seul élément Streamlit)
+        nova_card = f'''<div style="background: #1f2937; border: 1px solid #374151; border-radius: 12px; padding: 1.5rem; text-align: center; box-shadow: 0 1px 3px rgba(0,0,0,0.2);">
+<div style="color: #9ca3af; font-size: 0.7rem; text-transform: uppercase; letter-spacing: 1px;">Groupe NOVA</div>
+<div style="color: {NOVA_COLORS.get(nova, '#6b7280')}; font-size: 2.5rem; font-weight: 700; margin: 0.5rem 0;">{nova if nova else '?'}</div>
+<div style="color: #f9fafb; font-size: 0.85rem;">{NOVA_LABELS.get(nova, 'Non disponible')}</div>
+</div>'''
+        quality_card = f'''<div style="background: #1f2937; border: 1px solid #374151; border-radius: 12px; padding: 1.5rem; text-align: center; box-shadow: 0 1px 3px rgba(0,0,0,0.2);">
+<div style="color: #9ca3af; font-size: 0.7rem; text-transform: uppercase; letter-spacing: 1px;">Score Qualité</div>
+<div style="background: #374151; border-radius: 6px; height: 8px; overflow: hidden; margin: 1rem 0;">
+<div style="background: {progress_color}; width: {quality}%; height: 100%; border-radius: 6px;"></div>
+</div>
+<div style="color: #f9fafb; font-size: 1.5rem; font-weight: 600;">{quality}<span style="color: #6b7280; font-size: 0.9rem;">/100</span></div>
+</div>'''
+        st.markdown(STATCARDS_TPL.format(cols=2, cards=nova_card + quality_card), unsafe_allow_html=True)
     
     # LISTE PRODUITS
     else:
+        def sync_filters():
+            """Reporte les filtres dans l'URL et revient à la première page."""
+            set_query_param("search", st.session_state.product_search)
+            category = st.session_state.category_filter
+            set_query_param("category", category if category != "Toutes" else "")
+            selected = "".join(g for g in 'abcde' if st.session_state[f'nutri_{g}'])
+            set_query_param("nutri", (selected or "-") if len(selected) < 5 else "")
+            set_query_param("cursors", "")
+        
         def reset_filters():
-            st.session_state.current_page = 1
             st.session_state.product_search = ""
             st.session_state.category_filter = "Toutes"
             for g in ['a', 'b', 'c', 'd', 'e']:
                 st.session_state[f'nutri_{g}'] = True
+            for key in LIST_PARAMS:
+                set_query_param(key, "")
+        
+        # /categories et /items ne dépendent que de l'état des filtres (déjà connu avant
+        # le rendu des widgets) : les deux requêtes partent en parallèle
+        selected_nutri = [g for g in ['a', 'b', 'c', 'd', 'e'] if st.session_state[f'nutri_{g}']]
+        # Filtre Nutriscore appliqué côté serveur (pagination et total restent justes)
+        nutri_param = ",".join(selected_nutri) if 0 < len(selected_nutri) < 5 else ""
+        cursors = cursor_stack()
+        items_args = (cursors[-1] if cursors else "", len(cursors) + 1, 48, st.session_state.product_search,
+                      st.session_state.category_filter, nutri_param)
+        (categories_ok, categories), (items_ok, data) = api_get_many(cached_categories, lambda: cached_items(*items_args))
+        # Les échecs ne doivent pas rester en cache jusqu'à expiration du TTL
+        if not categories_ok:
+            cached_categories.clear()
+            categories = []
+        if not items_ok:
+            cached_items.clear()
         
         # Header de recherche stylisé
         st.markdown('<div class="section-header"><strong>🔍 Catalogue produits</strong></div>', unsafe_allow_html=True)
         
         col1, col2 = st.columns([5, 1])
         with col1:
-            search = st.text_input("Recherche", placeholder="🔎 Rechercher par nom, marque ou code-barres...", label_visibility="collapsed", key="product_search")
+            st.text_input("Recherche", placeholder="🔎 Rechercher par nom, marque ou code-barres...", label_visibility="collapsed", key="product_search", on_change=sync_filters)
         with col2:
             st.button("↻ Reset", use_container_width=True, on_click=reset_filters)
         
@@ -336,26 +572,14 @@ elif page_mode == "Produits":
             with f1:
                 st.markdown("<p style='color:#f9fafb; font-weight:500; margin-bottom:0.5rem;'>Nutriscore</p>", unsafe_allow_html=True)
                 nc = st.columns(5)
-                nutri_checks = {}
                 for i, g in enumerate(['a', 'b', 'c', 'd', 'e']):
                     with nc[i]:
-                        nutri_checks[g] = st.checkbox(g.upper(), key=f"nutri_{g}")
+                        st.checkbox(g.upper(), key=f"nutri_{g}", on_change=sync_filters)
             with f2:
                 st.markdown("<p style='color:#f9fafb; font-weight:500; margin-bottom:0.5rem;'>Catégorie</p>", unsafe_allow_html=True)
-                categories = api_get("/categories") or []
-                st.selectbox("Cat", ["Toutes"] + categories, label_visibility="collapsed", key="category_filter")
+                st.selectbox("Cat", ["Toutes"] + categories, label_visibility="collapsed", key="category_filter", on_change=sync_filters)
         
-        selected_nutri = [g for g in ['a', 'b', 'c', 'd', 'e'] if nutri_checks.get(g)]
-        
-        params = {"page": st.session_state.current_page, "page_size": 48}
-        if search:
-            params["search"] = search
-        if st.session_state.category_filter != "Toutes":
-            params["category"] = st.session_state.category_filter
-        
-        data = api_get("/items", params)
-        
-        if data and data["total"] > 0:
+        if items_ok and data["total"] > 0:
             # Pagination stylisée
             st.markdown(f'''
             <div style="display:flex; justify-content:space-between; align-items:center; background:#1f2937; border:1px solid #374151; border-radius:10px; padding:0.8rem 1.2rem; margin-bottom:1rem; box-shadow: 0 1px 2px rgba(0,0,0,0.15);">
@@ -364,53 +588,26 @@ elif page_mode == "Produits":
             </div>
             ''', unsafe_allow_html=True)
             
-            c1, c2, c3 = st.columns([1, 4, 1])
-            with c1:
-                if st.button("◀ Précédent", disabled=data["page"] <= 1, use_container_width=True):
-                    st.session_state.current_page -= 1
-                    st.rerun()
-            with c3:
-                if st.button("Suivant ▶", disabled=data["page"] >= data["total_pages"], use_container_width=True):
-                    st.session_state.current_page += 1
-                    st.rerun()
-            
-            st.markdown("<br>", unsafe_allow_html=True)
+            # Pagination par liens : l'état complet est dans l'URL, aucun widget à réconcilier
+            has_next = data["next_cursor"] is not None
+            prev_class = "pager-link" if cursors else "pager-link disabled"
+            next_class = "pager-link" if has_next else "pager-link disabled"
+            next_query = list_query(cursors + [data["next_cursor"]]) if has_next else ""
+            st.markdown(
+                f'<div style="display:grid; grid-template-columns:1fr 4fr 1fr; gap:0.5rem; margin-bottom:1.5rem;">'
+                f'<a href="?{list_query(cursors[:-1])}" target="_self" class="{prev_class}">◀ Précédent</a><span></span>'
+                f'<a href="?{next_query}" target="_self" class="{next_class}">Suivant ▶</a></div>',
+                unsafe_allow_html=True)
             
-            cols = st.columns(4)
-            items = data["items"] if not selected_nutri else [i for i in data["items"] if not i.get('nutriscore_grade') or i.get('nutriscore_grade', '').lower() in selected_nutri]
-            
-            for idx, item in enumerate(items):
-                with cols[idx % 4]:
-                    name = item['product_name'][:30] + '...' if len(item['product_name']) > 30 else item['product_name']
-                    nutri = item.get('nutriscore_grade', '')
-                    img_url = item.get('image_url')
-                    quality = item.get('quality_score') or 0
-                    nutri_colors = {'a': '#059669', 'b': '#84cc16', 'c': '#eab308', 'd': '#f97316', 'e': '#dc2626'}
-                    nutri_color = nutri_colors.get(nutri.lower(), '#9ca3af') if nutri else '#9ca3af'
-                    quality_color = '#10b981' if quality >= 70 else '#f59e0b' if quality >= 40 else '#ef4444'
-                    
-                    img_html = f'<img src="{img_url}" style="max-width:90%; max-height:120px; object-fit:contain;" />' if img_url else '<div style="font-size:3rem; color:#4b5563;">📦</div>'
-                    
-                    st.markdown(f'''
-                    <div style="background:#1f2937; border:1px solid #374151; border-radius:12px; padding:1rem; margin-bottom:1rem; transition:all 0.2s ease; box-shadow:0 1px 3px rgba(0,0,0,0.2);" onmouseover="this.style.boxShadow='0 4px 12px rgba(0,0,0,0.3)'; this.style.transform='translateY(-2px)';" onmouseout="this.style.boxShadow='0 1px 3px rgba(0,0,0,0.2)'; this.style.transform='translateY(0)';">
-                        <div style="width:100%; height:140px; background:#111827; border-radius:8px; display:flex; align-items:center; justify-content:center; overflow:hidden; margin-bottom:0.8rem;">
-                            {img_html}
-                        </div>
-                        <div style="color:#f9fafb; font-weight:500; font-size:0.9rem; min-height:2.4em; line-height:1.2; margin-bottom:0.3rem;">{name}</div>
-                        <div style="color:#6b7280; font-size:0.7rem; text-transform:uppercase; letter-spacing:0.3px; margin-bottom:0.8rem;">{item.get('brand') or 'Marque inconnue'}</div>
-                        <div style="display:flex; justify-content:space-between; align-items:center; padding-top:0.8rem; border-top:1px solid #374151;">
-                            <div style="background:{nutri_color}; width:28px; height:28px; border-radius:6px; display:flex; align-items:center; justify-content:center; font-weight:600; font-size:0.8rem; color:{'#1f2937' if nutri == 'c' else '#fff'};">{nutri.upper() if nutri else '?'}</div>
-                            <div style="text-align:right;">
-                                <div style="color:{quality_color}; font-weight:600; font-size:0.95rem;">{quality}</div>
-                                <div style="color:#6b7280; font-size:0.6rem;">/100</div>
-                            </div>
-                        </div>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                    
-                    if st.button("Voir détails", key=f"btn_{item['id']}", use_container_width=True):
-                        st.session_state.selected_product_id = item['id']
-                        st.rerun()
+            # Toutes les cartes dans une seule grille CSS, émise en un seul st.markdown ;
+            # le clic sur une carte passe par l'URL (?product_id=...) au lieu d'un st.button par carte
+            views = [_card_view(item) for item in data["items"]]
+            qs = list_query(cursors)
+            qs = qs + "&" if qs else ""
+            cards = "".join([CARD_TMPL.format(qs=qs, c=c) for c in views])
+            st.markdown(STATCARDS_TPL.format(cols=4, cards=cards), unsafe_allow_html=True)
+        elif not items_ok:
+            st.error("Impossible de charger les produits, réessayez dans un instant")
         else:
             st.markdown('''
             <div style="text-align:center; padding:4rem 2rem; background:#1f2937; border-radius:12px; border:1px solid #374151;">
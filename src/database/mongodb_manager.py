@@ -19,17 +19,16 @@ automatiquement l'ouverture et la fermeture de la connexion.
 =============================================================================
 """
 
-import hashlib  # Pour calculer des hash SHA-256 (empreintes uniques)
-import json  # Pour convertir des dictionnaires en chaînes JSON
+import hashlib  # Pour calculer des hash BLAKE2b (empreintes uniques)
+import orjson  # Sérialisation JSON en C, renvoie directement des bytes
 from datetime import datetime  # Pour les timestamps
-from typing import Optional, List  # Pour les annotations de type
+from typing import Iterator, Optional, List  # Pour les annotations de type
+from loguru import logger  # Journalisation des erreurs d'écriture partielles
 from pymongo import MongoClient, ASCENDING  # Client MongoDB et constantes d'index
+from pymongo.errors import BulkWriteError  # Erreurs partielles d'un insert_many / bulk_write
 from pymongo.database import Database  # Type pour la base de données
 from pymongo.collection import Collection  # Type pour les collections
 
-import sys
-sys.path.insert(0, str(__file__).rsplit("src", 1)[0])
-
 # Import des configurations MongoDB
 from config.settings import (
     MONGODB_URI,       # URI de connexion (mongodb://localhost:27017)
@@ -39,27 +38,83 @@ from config.settings import (
 )
 
 
-def compute_raw_hash(payload: dict) -> str:
+# Taille max d'un sous-lot insert_many (reste loin de la limite de 16 Mo par message BSON)
+INSERT_BATCH_SIZE = 1000
+# Code d'erreur MongoDB d'une violation d'index unique (doublon attendu)
+DUPLICATE_KEY_ERROR = 11000
+
+# Champs du payload OpenFoodFacts conservés dans products_raw : ceux lus par l'enrichissement.
+# Le reste (des centaines de champs) est volontairement écarté avant hachage et insertion.
+PAYLOAD_FIELDS = (
+    "code", "product_name", "brands", "nutriscore_grade", "nova_group", "completeness",
+    "main_category", "categories_tags", "nutriments",
+    "image_front_small_url", "image_front_url", "image_url", "image_small_url",
+)
+
+
+def compute_raw_hash(payload: dict) -> bytes:
     """
-    Calcule un hash SHA-256 unique pour un payload de produit.
+    Calcule une empreinte BLAKE2b unique pour un payload de produit.
     
     Ce hash sert à détecter les doublons : si deux produits ont
     exactement le même contenu, ils auront le même hash.
     
+    BLAKE2b produit directement 16 octets (128 bits, sans risque de collision à
+    l'échelle de la base), plus vite que SHA-256 sur ces petits payloads : stockés
+    en binaire BSON, ils rendent l'index unique sur raw_hash ~4x plus petit
+    qu'avec 64 caractères hexadécimaux.
+    
     Args:
         payload: Dictionnaire contenant les données du produit
         
     Returns:
-        str: Hash hexadécimal de 64 caractères (ex: "a1b2c3...")
+        bytes: Empreinte binaire de 16 octets
         
     Exemple:
-        >>> compute_raw_hash({"code": "123", "name": "Test"})
-        'e5b9e3b3c5a2f1d4...'  # Hash unique du contenu
+        >>> compute_raw_hash({"code": "123", "name": "Test"}).hex()
+        'e5b9e3b3c5a2f1d4...'  # Empreinte unique du contenu
     """
     # Convertir le dict en JSON trié (pour que l'ordre des clés n'affecte pas le hash)
-    payload_str = json.dumps(payload, sort_keys=True, ensure_ascii=False)
-    # Calculer le hash SHA-256 et le retourner en hexadécimal
-    return hashlib.sha256(payload_str.encode()).hexdigest()
+    payload_bytes = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    # Empreinte BLAKE2b de 16 octets (sans troncature)
+    return hashlib.blake2b(payload_bytes, digest_size=16).digest()
+
+
+def log_write_errors(error: BulkWriteError, operation: str, ignore_duplicates: bool = True) -> List[dict]:
+    """
+    Journalise les erreurs d'un bulk MongoDB (hors doublons d'index unique si ignore_duplicates).
+    
+    Returns:
+        List[dict]: Les writeErrors journalisées (vide si seuls des doublons ignorés ont échoué)
+    """
+    failed = [
+        err for err in error.details.get("writeErrors", [])
+        if not (ignore_duplicates and err.get("code") == DUPLICATE_KEY_ERROR)
+    ]
+    if failed:
+        logger.error(f"{operation} : {len(failed)} écriture(s) en échec, ex. : {failed[0].get('errmsg')}")
+    return failed
+
+
+def trim_payload(payload: dict) -> dict:
+    """Réduit un payload aux champs de PAYLOAD_FIELDS présents."""
+    return {k: payload[k] for k in PAYLOAD_FIELDS if k in payload}
+
+
+def compute_raw_hashes(payloads: List[dict]) -> List[bytes]:
+    """
+    Calcule les hash de tout un lot de payloads, dans l'ordre.
+    
+    Calcul dans le processus courant : un hash coûte moins que l'envoi du payload
+    (pickle) à un processus worker.
+    
+    Args:
+        payloads: Liste des données produits
+        
+    Returns:
+        List[bytes]: Hash de chaque payload, dans le même ordre
+    """
+    return [compute_raw_hash(payload) for payload in payloads]
 
 
 class MongoDBManager:
@@ -81,6 +136,7 @@ class MongoDBManager:
         database_name: Nom de la base de données
         _client: Client MongoDB (connexion)
         _db: Base de données MongoDB
+        _raw, _enriched: Collections RAW et ENRICHED (résolues une fois à la connexion)
     """
     
     def __init__(
@@ -101,6 +157,8 @@ class MongoDBManager:
         # mais seulement quand on en a besoin
         self._client: Optional[MongoClient] = None
         self._db: Optional[Database] = None
+        self._raw: Optional[Collection] = None
+        self._enriched: Optional[Collection] = None
     
     def connect(self) -> Database:
         """
@@ -114,9 +172,26 @@ class MongoDBManager:
         """
         if self._client is None:
             # Créer le client MongoDB (établit la connexion TCP)
-            self._client = MongoClient(self.uri)
+            # - compressors : BSON compressé sur le réseau ; zlib est intégré à Python
+            #   (zstd/snappy demanderaient zstandard/python-snappy, absents des dépendances)
+            # - w=1 sans journal : acquittement par le primaire, sans fsync du journal par lot.
+            #   Durabilité affaiblie : une panne du serveur peut perdre les dernières écritures
+            #   acquittées (acceptable ici, RAW/ENRICHED se reconstruisent par recollecte)
+            # - pool réduit : l'ingestion n'utilise que quelques connexions simultanées
+            self._client = MongoClient(
+                self.uri,
+                maxPoolSize=16,
+                maxConnecting=4,
+                compressors="zlib",
+                w=1,
+                journal=False,
+                retryWrites=True
+            )
             # Sélectionner la base de données (créée automatiquement si inexistante)
             self._db = self._client[self.database_name]
+            # Résoudre les collections une seule fois (réutilisées à chaque opération)
+            self._raw = self._db[COLLECTION_RAW]
+            self._enriched = self._db[COLLECTION_ENRICHED]
             # Créer les index pour optimiser les requêtes
             self._create_indexes()
         return self._db
@@ -131,6 +206,8 @@ class MongoDBManager:
             self._client.close()
             self._client = None
             self._db = None
+            self._raw = None
+            self._enriched = None
     
     # === CONTEXT MANAGER ===
     # Permet d'utiliser "with MongoDBManager() as mongo:"
@@ -154,8 +231,8 @@ class MongoDBManager:
         Index créés :
         - raw_hash (unique) : Empêche les doublons dans products_raw
         - fetched_at : Pour trier/filtrer par date de collecte
-        - raw_id (unique) : Lie products_enriched à products_raw
-        - status : Pour filtrer par statut (success/failed)
+        - raw_id (unique) : Lie products_enriched à products_raw (ObjectId du document RAW)
+        - (status, raw_id) : Filtre par statut (success/failed), couvre aussi raw_id
         """
         # Index sur la collection RAW
         raw_collection = self.get_raw_collection()
@@ -168,8 +245,12 @@ class MongoDBManager:
         enriched_collection = self.get_enriched_collection()
         # Index unique sur raw_id : un seul enrichissement par document RAW
         enriched_collection.create_index([("raw_id", ASCENDING)], unique=True)
-        # Index sur le statut (pour filtrer success/failed/pending)
-        enriched_collection.create_index([("status", ASCENDING)])
+        # Index composé (égalité sur status, puis raw_id) : sert les filtres par statut
+        # et couvre les requêtes qui ne projettent que raw_id
+        enriched_collection.create_index([("status", ASCENDING), ("raw_id", ASCENDING)], name="status_raw_id")
+        # L'ancien index simple sur status est un préfixe du composé : redondant
+        if "status_1" in enriched_collection.index_information():
+            enriched_collection.drop_index("status_1")
     
     @property
     def db(self) -> Database:
@@ -192,7 +273,9 @@ class MongoDBManager:
         Returns:
             Collection: Collection MongoDB 'products_raw'
         """
-        return self.db[COLLECTION_RAW]
+        if self._raw is None:
+            self.connect()
+        return self._raw
     
     def get_enriched_collection(self) -> Collection:
         """
@@ -201,7 +284,9 @@ class MongoDBManager:
         Returns:
             Collection: Collection MongoDB 'products_enriched'
         """
-        return self.db[COLLECTION_ENRICHED]
+        if self._enriched is None:
+            self.connect()
+        return self._enriched
     
     # =========================================================================
     # OPÉRATIONS SUR LES DOCUMENTS BRUTS (RAW)
@@ -214,16 +299,17 @@ class MongoDBManager:
         Le document est enrichi avec des métadonnées :
         - source : origine des données (ex: "openfoodfacts")
         - fetched_at : date/heure de collecte
-        - raw_hash : empreinte unique pour détecter les doublons
+        - raw_hash : empreinte unique (binaire 16 octets) pour détecter les doublons
         
         Args:
             payload: Données du produit telles que reçues de l'API
             source: Origine des données (par défaut: openfoodfacts)
             
         Returns:
-            str: Le raw_hash si insertion réussie, None si doublon
+            str: Le raw_hash (hexadécimal) si insertion réussie, None si doublon
         """
-        # Calculer le hash unique du payload
+        # Ne garder que les champs utiles, puis calculer le hash unique du payload
+        payload = trim_payload(payload)
         raw_hash = compute_raw_hash(payload)
         
         # Construire le document à insérer
@@ -234,13 +320,14 @@ class MongoDBManager:
             "payload": payload  # Les données brutes du produit
         }
         
-        try:
-            # Tenter l'insertion
-            self.get_raw_collection().insert_one(document)
-            return raw_hash  # Succès!
-        except Exception:
-            # L'insertion a échoué (probablement un doublon à cause de l'index unique)
-            return None
+        # Upsert avec $setOnInsert : un doublon est signalé par le résultat,
+        # sans lever (ni attraper) d'exception DuplicateKeyError
+        result = self.get_raw_collection().update_one(
+            {"raw_hash": raw_hash},
+            {"$setOnInsert": document},
+            upsert=True
+        )
+        return raw_hash.hex() if result.upserted_id is not None else None
     
     def insert_raw_documents_batch(self, payloads: List[dict], source: str = "openfoodfacts") -> int:
         """
@@ -249,7 +336,8 @@ class MongoDBManager:
         Plus efficace que d'appeler insert_raw_document en boucle car
         on réduit les allers-retours réseau avec MongoDB.
         
-        Les doublons sont ignorés silencieusement grâce à l'index unique.
+        Les doublons sont filtrés avant l'insertion (dans le lot, puis une requête $in
+        par sous-lot pour ceux déjà en base) ; l'index unique reste le garde-fou final.
         
         Args:
             payloads: Liste des données produits à insérer
@@ -260,28 +348,152 @@ class MongoDBManager:
         """
         # Timestamp commun pour tous les documents du batch
         fetched_at = datetime.utcnow().isoformat() + "Z"
-        inserted_count = 0
-        
-        for payload in payloads:
-            # Calculer le hash de chaque payload
-            raw_hash = compute_raw_hash(payload)
-            
-            document = {
+        payloads = [trim_payload(payload) for payload in payloads]
+        documents = []
+        batch_hashes = set()
+        for raw_hash, payload in zip(compute_raw_hashes(payloads), payloads):
+            # Doublons dans ce même lot (ceux déjà en base sont écartés par sous-lot)
+            if raw_hash in batch_hashes:
+                continue
+            batch_hashes.add(raw_hash)
+            documents.append({
                 "source": source,
                 "fetched_at": fetched_at,
                 "raw_hash": raw_hash,
                 "payload": payload
+            })
+        
+        collection = self.get_raw_collection()
+        inserted_count = 0
+        
+        for start in range(0, len(documents), INSERT_BATCH_SIZE):
+            chunk = documents[start:start + INSERT_BATCH_SIZE]
+            chunk_hashes = [doc["raw_hash"] for doc in chunk]
+            # Hash déjà présents en base : une seule requête couverte par l'index raw_hash
+            existing = {
+                doc["raw_hash"]
+                for doc in collection.find({"raw_hash": {"$in": chunk_hashes}}, {"raw_hash": 1, "_id": 0})
             }
-            
+            chunk = [doc for doc in chunk if doc["raw_hash"] not in existing]
+            if not chunk:
+                continue
             try:
-                self.get_raw_collection().insert_one(document)
-                inserted_count += 1  # Compter les insertions réussies
-            except Exception:
-                # Ignorer les doublons (l'exception vient de l'index unique)
-                pass
+                # ordered=False : un doublon n'interrompt pas le reste du lot
+                collection.insert_many(chunk, ordered=False)
+                inserted_count += len(chunk)
+            except BulkWriteError as e:
+                # Les doublons (index unique) remontent en writeErrors, le reste est inséré ;
+                # toute autre erreur (validation, document trop gros...) est journalisée
+                log_write_errors(e, "Insertion RAW")
+                inserted_count += e.details.get("nInserted", 0)
         
         return inserted_count
     
+    @staticmethod
+    def _update_dropping_duplicates(collection: Collection, ids: List, operations: List, operation: str) -> tuple:
+        """
+        Applique un lot d'UpdateOne ; les documents dont la mise à jour heurte un index
+        unique (doublon) sont supprimés. ids[i] est l'_id visé par operations[i].
+        
+        Returns:
+            tuple: (nombre de documents modifiés, _id des doublons supprimés)
+        """
+        try:
+            return collection.bulk_write(operations, ordered=False).modified_count, []
+        except BulkWriteError as e:
+            log_write_errors(e, operation)
+            duplicate_ids = [
+                ids[err["index"]] for err in e.details.get("writeErrors", [])
+                if err.get("code") == DUPLICATE_KEY_ERROR
+            ]
+            if duplicate_ids:
+                collection.delete_many({"_id": {"$in": duplicate_ids}})
+            return e.details.get("nModified", 0), duplicate_ids
+    
+    def migrate_enriched_raw_ids(self) -> dict:
+        """
+        Convertit en ObjectId les raw_id enregistrés en chaîne hexadécimale (ancien format).
+        
+        Un raw_id chaîne ne correspond jamais à l'ObjectId utilisé par les upserts
+        d'enrich_data.py (types BSON différents, l'index unique ne les confond pas) :
+        chaque produit réenrichi aurait deux documents. Si le document au format
+        ObjectId existe déjà, l'ancien (chaîne) est supprimé. Relancée, la migration
+        ne modifie plus rien.
+        
+        Returns:
+            dict: {"converted": raw_id convertis, "removed": doublons supprimés}
+        """
+        from bson import ObjectId
+        from pymongo import UpdateOne
+        
+        collection = self.get_enriched_collection()
+        stats = {"converted": 0, "removed": 0}
+        
+        def flush(ids: List, operations: List[UpdateOne]):
+            modified, duplicate_ids = self._update_dropping_duplicates(collection, ids, operations, "Migration raw_id ENRICHED")
+            stats["converted"] += modified
+            stats["removed"] += len(duplicate_ids)
+        
+        ids, operations = [], []
+        cursor = collection.find({"raw_id": {"$type": "string"}}, {"raw_id": 1}).batch_size(INSERT_BATCH_SIZE)
+        for doc in cursor:
+            if not ObjectId.is_valid(doc["raw_id"]):
+                continue
+            ids.append(doc["_id"])
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"raw_id": ObjectId(doc["raw_id"])}}))
+            if len(operations) >= INSERT_BATCH_SIZE:
+                flush(ids, operations)
+                ids, operations = [], []
+        if operations:
+            flush(ids, operations)
+        return stats
+    
+    def rehash_raw_documents(self) -> dict:
+        """
+        Migre products_raw vers le format de hash actuel (payload réduit, BLAKE2b 16 octets).
+        
+        Les documents collectés avec l'ancien format (SHA-256 hexadécimal du payload
+        complet) ne seraient jamais reconnus comme doublons par une nouvelle collecte :
+        leur payload est réduit à PAYLOAD_FIELDS et leur raw_hash recalculé. Un document
+        dont le nouveau hash existe déjà (index unique) est un doublon : il est supprimé,
+        avec son document enrichi (raw_id ObjectId ou ancien format chaîne). Relancée,
+        la migration ne modifie plus rien.
+        
+        Returns:
+            dict: {"updated": nombre de documents migrés, "removed": doublons supprimés}
+        """
+        from pymongo import UpdateOne
+        
+        collection = self.get_raw_collection()
+        stats = {"updated": 0, "removed": 0}
+        
+        def flush(ids: List, operations: List[UpdateOne]):
+            modified, duplicate_ids = self._update_dropping_duplicates(collection, ids, operations, "Migration RAW")
+            stats["updated"] += modified
+            stats["removed"] += len(duplicate_ids)
+            if duplicate_ids:
+                # Documents enrichis des doublons, raw_id ObjectId ou ancien format chaîne
+                self.get_enriched_collection().delete_many(
+                    {"raw_id": {"$in": duplicate_ids + [str(_id) for _id in duplicate_ids]}}
+                )
+        
+        ids, operations = [], []
+        # Parcours par _id : les documents modifiés ne sont pas revus par le curseur
+        cursor = collection.find({}, {"raw_hash": 1, "payload": 1}).sort("_id", ASCENDING).batch_size(INSERT_BATCH_SIZE)
+        for doc in cursor:
+            payload = trim_payload(doc.get("payload") or {})
+            raw_hash = compute_raw_hash(payload)
+            if doc.get("raw_hash") == raw_hash:
+                continue
+            ids.append(doc["_id"])
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"raw_hash": raw_hash, "payload": payload}}))
+            if len(operations) >= INSERT_BATCH_SIZE:
+                flush(ids, operations)
+                ids, operations = [], []
+        if operations:
+            flush(ids, operations)
+        return stats
+    
     def count_raw_documents(self) -> int:
         """
         Compte le nombre total de documents bruts.
@@ -291,6 +503,21 @@ class MongoDBManager:
         """
         return self.get_raw_collection().count_documents({})
     
+    def iter_raw_documents_for_enrichment(self, batch_size: int = 500) -> Iterator[dict]:
+        """
+        Parcourt les documents bruts à enrichir sans tout charger en mémoire.
+        
+        Le curseur ramène les documents par lots de batch_size, avec seulement
+        les champs utiles à l'enrichissement (_id et payload).
+        
+        Args:
+            batch_size: Nombre de documents par aller-retour avec MongoDB
+            
+        Returns:
+            Iterator[dict]: Curseur sur les documents RAW
+        """
+        return self.get_raw_collection().find({}, projection={"_id": 1, "payload": 1}).batch_size(batch_size)
+    
     def get_raw_documents_for_enrichment(self) -> List[dict]:
         """
         Récupère tous les documents bruts pour les enrichir.
@@ -298,7 +525,7 @@ class MongoDBManager:
         Returns:
             List[dict]: Liste de tous les documents RAW
         """
-        return list(self.get_raw_collection().find({}))
+        return list(self.iter_raw_documents_for_enrichment())
     
     # =========================================================================
     # OPÉRATIONS SUR LES DOCUMENTS ENRICHIS (ENRICHED)
@@ -315,7 +542,7 @@ class MongoDBManager:
             enriched_doc: Document enrichi à insérer
             
         Returns:
-            str: Le raw_id si succès, None sinon
+            str: Le raw_id (forme hexadécimale) si succès, None sinon
         """
         try:
             # update_one avec upsert=True : crée ou met à jour
@@ -324,7 +551,7 @@ class MongoDBManager:
                 {"$set": enriched_doc},  # Données à insérer/mettre à jour
                 upsert=True  # Créer si inexistant
             )
-            return enriched_doc["raw_id"]
+            return str(enriched_doc["raw_id"])
         except Exception:
             return None
     
@@ -336,13 +563,17 @@ class MongoDBManager:
         toutes les opérations sont envoyées en une seule requête.
         
         Args:
-            enriched_docs: Liste des documents enrichis
+            enriched_docs: Liste des documents enrichis (dicts, ou objets exposant
+                to_document() comme les EnrichedRecord de l'enrichissement par lot)
             
         Returns:
             int: Nombre de documents insérés/modifiés
         """
         from pymongo import UpdateOne
         
+        # Les résultats d'enrichissement ne deviennent des dicts qu'ici, à l'écriture
+        enriched_docs = [doc if isinstance(doc, dict) else doc.to_document() for doc in enriched_docs]
+        
         # Construire la liste des opérations bulk
         operations = [
             UpdateOne(
@@ -353,12 +584,19 @@ class MongoDBManager:
             for doc in enriched_docs if doc.get("raw_id")  # Ignorer les docs sans raw_id
         ]
         
-        if operations:
+        if not operations:
+            return 0
+        try:
             # Exécuter toutes les opérations en une seule requête (très efficace!)
-            result = self.get_enriched_collection().bulk_write(operations)
-            # Retourner le total des docs créés + modifiés
-            return result.upserted_count + result.modified_count
-        return 0
+            # ordered=False : une erreur sur un document n'annule pas les suivants
+            result = self.get_enriched_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Les opérations sans erreur ont été appliquées : compter celles-ci. Un upsert
+            # par raw_id ne devrait pas échouer, doublon compris : tout est journalisé
+            log_write_errors(e, "Écriture ENRICHED", ignore_duplicates=False)
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+        # Retourner le total des docs créés + modifiés
+        return result.upserted_count + result.modified_count
     
     def count_enriched_documents(self, status: Optional[str] = None) -> int:
         """
@@ -374,6 +612,24 @@ class MongoDBManager:
         query = {"status": status} if status else {}
         return self.get_enriched_collection().count_documents(query)
     
+    def iter_enriched_documents(self, status: Optional[str] = None, limit: int = 0,
+                                batch_size: int = INSERT_BATCH_SIZE,
+                                projection: Optional[dict] = None) -> Iterator[dict]:
+        """
+        Parcourt les documents enrichis sans tout charger en mémoire.
+        
+        Args:
+            status: Filtre optionnel par statut
+            limit: Nombre maximum de documents (0 = pas de limite)
+            batch_size: Nombre de documents par aller-retour avec MongoDB
+            projection: Champs à ramener (tous si None)
+            
+        Returns:
+            Iterator[dict]: Curseur sur les documents enrichis
+        """
+        query = {"status": status} if status else {}
+        return self.get_enriched_collection().find(query, projection).limit(limit).batch_size(batch_size)
+    
     def get_enriched_documents(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
         """
         Récupère les documents enrichis avec filtrage et limitation.
@@ -385,5 +641,4 @@ class MongoDBManager:
         Returns:
             List[dict]: Liste des documents enrichis
         """
-        query = {"status": status} if status else {}
-        return list(self.get_enriched_collection().find(query).limit(limit))
+        return list(self.iter_enriched_documents(status, limit))
@@ -1,88 +1,347 @@
 """Module d'enrichissement des données."""
 
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
+from functools import lru_cache, partial
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Optional
+
+import numpy as np
+import orjson
+import pandas as pd
+try:
+    from numba import njit  # Compilation JIT du noyau de score (optionnelle)
+except ImportError:
+    njit = None
 
 NUTRISCORE_SCORES = {"a": 100, "b": 80, "c": 60, "d": 40, "e": 20}
+# Part Nutriscore du score qualité (déjà pondérée × 0.5), en minuscules et majuscules
+_NUTRI_HALVED = {k: v * 0.5 for k, v in NUTRISCORE_SCORES.items()}
+_NUTRI_HALVED.update({k.upper(): v for k, v in _NUTRI_HALVED.items()})
+# Table de traduction des tirets en espaces pour les tags de catégorie
+_DASH_TO_SPACE = str.maketrans("-", " ")
+# Champs d'image du payload, par ordre de préférence
+_IMG_KEYS = ("image_front_small_url", "image_front_url", "image_url", "image_small_url")
+# Champs nutritionnels enrichis -> clés OpenFoodFacts (valeurs pour 100g)
+NUTRIMENT_KEYS = (
+    ("energy_kcal", "energy-kcal_100g"),
+    ("fat", "fat_100g"),
+    ("saturated_fat", "saturated-fat_100g"),
+    ("carbohydrates", "carbohydrates_100g"),
+    ("sugars", "sugars_100g"),
+    ("fiber", "fiber_100g"),
+    ("proteins", "proteins_100g"),
+    ("salt", "salt_100g"),
+)
+
+
+@dataclass(slots=True)
+class Nutrition:
+    """Valeurs nutritionnelles pour 100g (mêmes champs et ordre que NUTRIMENT_KEYS)."""
+    energy_kcal: Optional[float] = None
+    fat: Optional[float] = None
+    saturated_fat: Optional[float] = None
+    carbohydrates: Optional[float] = None
+    sugars: Optional[float] = None
+    fiber: Optional[float] = None
+    proteins: Optional[float] = None
+    salt: Optional[float] = None
+    
+    def to_dict(self) -> dict:
+        """Sous-document 'nutrition' de products_enriched."""
+        return {
+            "energy_kcal": self.energy_kcal,
+            "fat": self.fat,
+            "saturated_fat": self.saturated_fat,
+            "carbohydrates": self.carbohydrates,
+            "sugars": self.sugars,
+            "fiber": self.fiber,
+            "proteins": self.proteins,
+            "salt": self.salt,
+        }
+
+
+@dataclass(slots=True)
+class EnrichedData:
+    """Données calculées d'un produit enrichi."""
+    code: str
+    product_name: str
+    brands: str
+    quality_score: int
+    category: str
+    nutriscore_grade: str
+    nova_group: Optional[int]
+    image_url: Optional[str]
+    nutrition: Nutrition
+
+
+@dataclass(slots=True)
+class EnrichedRecord:
+    """Résultat d'enrichissement ; converti en document MongoDB seulement à l'écriture."""
+    raw_id: Any
+    status: str
+    enriched_at: Optional[str]
+    data: Optional[EnrichedData] = None
+    error: Optional[dict] = None
+    
+    def to_document(self) -> dict:
+        """Document products_enriched correspondant (format historique d'enrich_product)."""
+        d = self.data
+        doc = {
+            "raw_id": self.raw_id,
+            "status": self.status,
+            "enriched_at": self.enriched_at,
+            "data": {
+                "code": d.code,
+                "product_name": d.product_name,
+                "brands": d.brands,
+                "quality_score": d.quality_score,
+                "category": d.category,
+                "nutriscore_grade": d.nutriscore_grade,
+                "nova_group": d.nova_group,
+                "image_url": d.image_url,
+                "nutrition": d.nutrition.to_dict(),
+            } if d is not None else {},
+        }
+        if self.error is not None:
+            doc["error"] = self.error
+        return doc
+
+
+def utc_now_iso() -> str:
+    """Horodatage UTC ISO 8601 à la milliseconde, suffixé par Z (ex: 2026-01-01T00:00:00.000Z)."""
+    # Le suffixe "+00:00" est toujours en fin de chaîne : découpe plutôt que replace
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")[:-6] + "Z"
+
+
+def enrich_product(raw_doc: dict, max_retries: int = 2, now_iso: Optional[str] = None,
+                   quality_score: Optional[int] = None) -> dict:
+    """
+    Enrichit un document brut avec score qualité, catégorie, image et nutrition.
+    
+    now_iso : horodatage commun à tout un lot (calculé ici s'il n'est pas fourni).
+    quality_score : score déjà calculé par lot (calculé ici s'il n'est pas fourni).
+    """
+    return enrich_record(raw_doc, max_retries, now_iso, quality_score).to_document()
+
+
+def enrich_record(raw_doc: dict, max_retries: int = 2, now_iso: Optional[str] = None,
+                  quality_score: Optional[int] = None, category: Optional[str] = None) -> EnrichedRecord:
+    """
+    Comme enrich_product, mais renvoie un EnrichedRecord (sans dicts intermédiaires).
+    
+    quality_score / category : valeurs déjà calculées par lot, sinon calculées ici.
+    max_retries : conservé pour compatibilité, sans effet (le calcul est déterministe,
+    sans I/O : une nouvelle tentative échouerait de la même façon).
+    """
+    # _id conservé tel quel (ObjectId) : stocké et indexé en binaire 12 octets dans raw_id
+    raw_id = raw_doc.get("_id", "")
+    enriched_at = now_iso or utc_now_iso()
+    try:
+        payload = _load_payload(raw_doc.get("payload", {}))
+        if not isinstance(payload, dict):
+            raise TypeError(f"payload de type {type(payload).__name__}, dict attendu")
+        return EnrichedRecord(raw_id, "success", enriched_at, EnrichedData(
+            payload.get("code", ""),
+            payload.get("product_name", ""),
+            payload.get("brands", ""),
+            quality_score if quality_score is not None else _calculate_quality_score(payload),
+            category if category is not None else _categorize_product(payload),
+            payload.get("nutriscore_grade", ""),
+            payload.get("nova_group"),
+            _extract_image_url(payload),
+            Nutrition(*_nutrition_from(payload.get("nutriments", {}))),
+        ))
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        # Données inexploitables (types inattendus, JSON invalide) : échec immédiat
+        return EnrichedRecord(raw_id, "failed", enriched_at,
+                              error={"code": type(e).__name__, "message": str(e)})
+
+
+# Documents lus à la fois sur le flux, et taille des sous-lots confiés à chaque processus
+ENRICH_WINDOW = 1024
+ENRICH_SUB_CHUNK = 128
+
+
+def enrich_batch(raw_docs: Iterable[dict], workers: Optional[int] = None,
+                 now_iso: Optional[str] = None, window: int = ENRICH_WINDOW) -> Iterator[EnrichedRecord]:
+    """
+    Enrichit un flux de documents bruts en parallèle (un processus par cœur par défaut).
+    
+    Les documents sont lus par fenêtres de `window` pour ne pas consommer tout le
+    curseur d'un coup ; les résultats sont rendus dans l'ordre d'entrée.
+    """
+    enrich = partial(_enrich_chunk, now_iso=now_iso or utc_now_iso())
+    docs = iter(raw_docs)
+    with ProcessPoolExecutor(workers) as executor:
+        while True:
+            chunk = list(islice(docs, window))
+            if not chunk:
+                return
+            # Chaque worker reçoit un sous-lot (scores vectorisés par sous-lot)
+            sub_chunks = [chunk[i:i + ENRICH_SUB_CHUNK] for i in range(0, len(chunk), ENRICH_SUB_CHUNK)]
+            for results in executor.map(enrich, sub_chunks):
+                yield from results
+
+
+def enrich_products(raw_docs: List[dict], now_iso: Optional[str] = None, workers: Optional[int] = None) -> List[dict]:
+    """
+    Enrichit une liste de documents bruts par lots vectorisés, avec un horodatage commun au lot.
+    
+    Même résultat que [enrich_product(doc, now_iso=now_iso) for doc in raw_docs].
+    Jusqu'à une fenêtre (ENRICH_WINDOW documents) ou avec workers=1, le calcul reste
+    dans le processus courant ; au-delà, la liste passe par enrich_batch.
+    """
+    now_iso = now_iso or utc_now_iso()
+    if workers == 1 or len(raw_docs) <= ENRICH_WINDOW:
+        records = _enrich_chunk(raw_docs, now_iso)
+    else:
+        records = enrich_batch(raw_docs, workers, now_iso)
+    return [record.to_document() for record in records]
 
 
-def enrich_product(raw_doc: dict, max_retries: int = 2) -> dict:
-    """Enrichit un document brut avec score qualité, catégorie, image et nutrition."""
-    raw_id = str(raw_doc.get("_id", ""))
-    payload = raw_doc.get("payload", {})
+class EnrichBatch:
+    """
+    Sous-lot de documents bruts rangé en colonnes (SoA) : les payloads sont lus une
+    fois, puis score qualité et catégorie sont calculés par colonne.
+    Les dicts de sortie ne sont construits qu'à la fin, dans records().
+    """
+    __slots__ = ("raw_docs", "payloads", "quality_scores", "categories", "nutrition")
     
-    for attempt in range(max_retries + 1):
-        try:
-            return {
-                "raw_id": raw_id,
-                "status": "success",
-                "enriched_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-                "data": {
-                    "code": payload.get("code", ""),
-                    "product_name": payload.get("product_name", ""),
-                    "brands": payload.get("brands", ""),
-                    "quality_score": _calculate_quality_score(payload),
-                    "category": _categorize_product(payload),
-                    "nutriscore_grade": payload.get("nutriscore_grade", ""),
-                    "nova_group": payload.get("nova_group"),
-                    "image_url": _extract_image_url(payload),
-                    "nutrition": _extract_nutrition(payload),
-                }
-            }
-        except Exception as e:
-            if attempt == max_retries:
-                return {
-                    "raw_id": raw_id,
-                    "status": "failed",
-                    "enriched_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
-                    "data": {},
-                    "error": {"code": type(e).__name__, "message": str(e)}
-                }
+    def __init__(self, raw_docs: List[dict]):
+        self.raw_docs = raw_docs
+        self.payloads = [_load_payload(doc.get("payload", {})) for doc in raw_docs]
+        self.quality_scores = calculate_quality_scores_batch(self.payloads)
+        self.categories = categorize_products_batch(self.payloads)
+        # Valeurs nutritionnelles gardées telles quelles (int, float, chaîne) comme par document
+        self.nutrition = [_nutrition_from(p.get("nutriments", {})) for p in self.payloads]
     
-    return {"raw_id": raw_id, "status": "pending", "enriched_at": None, "data": {}}
+    def records(self, now_iso: str) -> List[EnrichedRecord]:
+        """Résultats du sous-lot, dans l'ordre des documents."""
+        records = []
+        for doc, payload, score, category, row in zip(self.raw_docs, self.payloads, self.quality_scores,
+                                                      self.categories, self.nutrition):
+            records.append(EnrichedRecord(doc.get("_id", ""), "success", now_iso, EnrichedData(
+                payload.get("code", ""),
+                payload.get("product_name", ""),
+                payload.get("brands", ""),
+                score,
+                category,
+                payload.get("nutriscore_grade", ""),
+                payload.get("nova_group"),
+                _extract_image_url(payload),
+                Nutrition(*row),
+            )))
+        return records
+
+
+def _load_payload(payload):
+    """Payload brut en dict (les payloads reçus en bytes/str JSON sont décodés avec orjson)."""
+    return orjson.loads(payload) if isinstance(payload, (bytes, str)) else payload
+
+
+def _enrich_chunk(raw_docs: List[dict], now_iso: str) -> List[EnrichedRecord]:
+    """Enrichit un sous-lot en colonnes (EnrichBatch), ou document par document en cas de payload atypique."""
+    try:
+        return EnrichBatch(raw_docs).records(now_iso)
+    except (TypeError, ValueError, AttributeError):
+        # Payload atypique (ex: complétude non numérique) : calcul et gestion d'erreur par document
+        return [enrich_record(doc, now_iso=now_iso) for doc in raw_docs]
+
+
+def _quality_kernel_numpy(nutri: np.ndarray, completeness: np.ndarray) -> np.ndarray:
+    """Score qualité à partir des colonnes (part Nutriscore déjà pondérée, complétude)."""
+    return np.minimum(nutri + completeness * 50, 100).astype(np.int64)
+
+
+def _quality_kernel_loop(nutri, completeness):
+    """Même calcul en une seule boucle, compilée par Numba (pas de tableau intermédiaire)."""
+    out = np.empty(nutri.shape[0], np.int64)
+    for i in range(nutri.shape[0]):
+        score = nutri[i] + completeness[i] * 50
+        out[i] = int(score) if score <= 100 else 100
+    return out
+
+
+# Noyau compilé si Numba est installé (cache disque pour éviter la compilation à chaque lancement)
+_quality_kernel = njit(cache=True)(_quality_kernel_loop) if njit is not None else _quality_kernel_numpy
+
+
+def calculate_quality_scores_batch(payloads: List[dict]) -> List[int]:
+    """
+    Version vectorisée de _calculate_quality_score sur une liste de payloads.
+    
+    Une complétude non numérique (ex: "0.8") ou non finie (NaN, inf) renvoie au calcul
+    par document, pour en garder exactement les résultats et les erreurs.
+    """
+    values = [p.get("completeness") or 0 for p in payloads]
+    if not all(isinstance(v, (int, float)) for v in values):
+        return [_calculate_quality_score(p) for p in payloads]
+    completeness = np.array(values, dtype=np.float64)
+    if not np.isfinite(completeness).all():
+        return [_calculate_quality_score(p) for p in payloads]
+    nutri = np.fromiter((_NUTRI_HALVED.get(p.get("nutriscore_grade") or "", 0.0) for p in payloads),
+                        dtype=np.float64, count=len(payloads))
+    return _quality_kernel(nutri, completeness).tolist()
+
+
+def categorize_products_batch(payloads: List[dict]) -> List[str]:
+    """Version vectorisée de _categorize_product (opérations .str de pandas sur toute la colonne)."""
+    tags = pd.Series(
+        [p.get("main_category") or (p.get("categories_tags") or [None])[0] for p in payloads],
+        dtype=object
+    )
+    formatted = tags.str.replace("en:", "", regex=False).str.replace("-", " ", regex=False).str.title()
+    categories = formatted.where(tags.notna(), "Non catégorisé")
+    if categories.isna().any():
+        # Tag non textuel : laisser le calcul par document gérer l'erreur
+        raise ValueError("tag de catégorie non textuel")
+    return categories.tolist()
 
 
 def _calculate_quality_score(payload: dict) -> int:
     """Calcule le score qualité (0-100) basé sur Nutriscore + complétude."""
-    nutriscore = payload.get("nutriscore_grade", "").lower()
-    score = NUTRISCORE_SCORES.get(nutriscore, 0) * 0.5
-    score += (payload.get("completeness", 0) or 0) * 50
-    return int(min(score, 100))
+    score = _NUTRI_HALVED.get(payload.get("nutriscore_grade") or "", 0.0)
+    score += (payload.get("completeness") or 0) * 50
+    return int(score) if score <= 100 else 100
+
+
+@lru_cache(maxsize=8192)
+def _format_category(tag: str) -> str:
+    """Formate un tag de catégorie (en:breakfast-cereals -> Breakfast Cereals), une fois par tag distinct."""
+    return tag.replace("en:", "").translate(_DASH_TO_SPACE).title()
 
 
 def _categorize_product(payload: dict) -> str:
     """Détermine la catégorie principale du produit."""
     main_cat = payload.get("main_category", "")
     if main_cat:
-        return main_cat.replace("en:", "").replace("-", " ").title()
+        return _format_category(main_cat)
     
     categories = payload.get("categories_tags", [])
     if categories:
-        return categories[0].replace("en:", "").replace("-", " ").title()
+        return _format_category(categories[0])
     
     return "Non catégorisé"
 
 
 def _extract_image_url(payload: dict) -> Optional[str]:
-    """Extrait l'URL de l'image du produit."""
-    return (
-        payload.get("image_front_small_url") or
-        payload.get("image_front_url") or
-        payload.get("image_url") or
-        payload.get("image_small_url")
-    )
+    """Extrait l'URL de l'image du produit (première URL non vide de _IMG_KEYS)."""
+    get = payload.get
+    for key in _IMG_KEYS:
+        if url := get(key):
+            return url
+    return None
+
+
+def _nutrition_from(n: dict) -> tuple:
+    """Valeurs nutritionnelles d'un dict nutriments, dans l'ordre de NUTRIMENT_KEYS."""
+    get = n.get
+    return (get("energy-kcal_100g"), get("fat_100g"), get("saturated-fat_100g"), get("carbohydrates_100g"),
+            get("sugars_100g"), get("fiber_100g"), get("proteins_100g"), get("salt_100g"))
 
 
 def _extract_nutrition(payload: dict) -> dict:
     """Extrait les données nutritionnelles pour 100g."""
-    n = payload.get("nutriments", {})
-    return {
-        "energy_kcal": n.get("energy-kcal_100g"),
-        "fat": n.get("fat_100g"),
-        "saturated_fat": n.get("saturated-fat_100g"),
-        "carbohydrates": n.get("carbohydrates_100g"),
-        "sugars": n.get("sugars_100g"),
-        "fiber": n.get("fiber_100g"),
-        "proteins": n.get("proteins_100g"),
-        "salt": n.get("salt_100g"),
-    }
+    return Nutrition(*_nutrition_from(payload.get("nutriments", {}))).to_dict()
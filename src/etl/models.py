@@ -1,15 +1,24 @@
 """Modèles SQLAlchemy pour la base de données SQL."""
 
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Index
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+from sqlalchemy import create_engine, event, func, inspect, or_, select, text, update, Column, Integer, SmallInteger, String, Float, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Session
 
-import sys
-sys.path.insert(0, str(__file__).rsplit("src", 1)[0])
 from config.settings import SQLITE_PATH, POSTGRES_URI, USE_SQLITE
 
 Base = declarative_base()
 
+NUTRITION_FIELDS = ('energy_kcal', 'fat', 'saturated_fat', 'carbohydrates', 'sugars', 'fiber', 'proteins', 'salt')
+# Colonnes mises à jour quand un produit (même code) est rechargé
+PRODUCT_UPDATE_FIELDS = ('product_name', 'brand_id', 'category_id', 'nutriscore_grade', 'nova_group', 'quality_score', 'image_url')
+# Pragmas SQLite appliqués à chaque connexion : WAL (lecteurs concurrents d'un écrivain),
+# pas de fsync à chaque commit, tables temporaires en mémoire, cache 64 Mo, mmap 256 Mo
+SQLITE_PRAGMAS = ("journal_mode=WAL", "synchronous=NORMAL", "temp_store=MEMORY",
+                  "cache_size=-65536", "mmap_size=268435456")
+
 
 class Brand(Base):
     """Table des marques."""
@@ -37,18 +46,30 @@ class Product(Base):
     code = Column(String(50), unique=True, nullable=False, index=True)
     product_name = Column(String(500), nullable=False)
     image_url = Column(String(500), nullable=True)
-    brand_id = Column(Integer, ForeignKey('brands.id'), index=True)
-    category_id = Column(Integer, ForeignKey('categories.id'), index=True)
-    nutriscore_grade = Column(String(1), index=True)
-    nova_group = Column(Integer)
-    quality_score = Column(Integer, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    brand_id = Column(Integer, ForeignKey('brands.id'))
+    category_id = Column(Integer, ForeignKey('categories.id'))
+    nutriscore_grade = Column(String(1))
+    # Petites plages de valeurs (1-4, 0-100) : SMALLINT sur 2 octets
+    nova_group = Column(SmallInteger)
+    quality_score = Column(SmallInteger)
+    # Horodatage calculé par la base (now() dans l'INSERT : pas de datetime Python par ligne).
+    # default= en plus du DEFAULT de schéma : les tables créées avant n'ont pas de DEFAULT
+    # (create_all ne modifie pas une table existante) et recevraient NULL
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
     
     brand = relationship("Brand", back_populates="products")
     category = relationship("Category", back_populates="products")
     nutrition = relationship("NutritionFacts", back_populates="product", uselist=False)
     
-    __table_args__ = (Index('idx_nutriscore_quality', 'nutriscore_grade', 'quality_score'),)
+    # Index limités aux requêtes réelles (chaque index en plus coûte à chaque INSERT) :
+    # le préfixe nutriscore_grade / category_id sert aussi les filtres simples.
+    __table_args__ = (
+        # INCLUDE id (PostgreSQL) : GROUP BY nutriscore_grade / count(id) en parcours d'index seul
+        Index('idx_nutriscore_quality', 'nutriscore_grade', 'quality_score', postgresql_include=['id']),
+        Index('idx_cat_quality', 'category_id', 'quality_score',
+              postgresql_include=['product_name', 'nutriscore_grade']),
+        Index('idx_brand', 'brand_id'),
+    )
 
 
 class NutritionFacts(Base):
@@ -57,33 +78,230 @@ class NutritionFacts(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     product_id = Column(Integer, ForeignKey('products.id'), unique=True, nullable=False)
-    energy_kcal = Column(Float, nullable=True)
-    fat = Column(Float, nullable=True)
-    saturated_fat = Column(Float, nullable=True)
-    carbohydrates = Column(Float, nullable=True)
-    sugars = Column(Float, nullable=True)
-    fiber = Column(Float, nullable=True)
-    proteins = Column(Float, nullable=True)
-    salt = Column(Float, nullable=True)
+    # Valeurs pour 100g en simple précision (REAL, 4 octets) : largement suffisant ici
+    energy_kcal = Column(Float(precision=24), nullable=True)
+    fat = Column(Float(precision=24), nullable=True)
+    saturated_fat = Column(Float(precision=24), nullable=True)
+    carbohydrates = Column(Float(precision=24), nullable=True)
+    sugars = Column(Float(precision=24), nullable=True)
+    fiber = Column(Float(precision=24), nullable=True)
+    proteins = Column(Float(precision=24), nullable=True)
+    salt = Column(Float(precision=24), nullable=True)
     
     product = relationship("Product", back_populates="nutrition")
 
 
+def _set_sqlite_pragmas(dbapi_conn, _connection_record):
+    """Applique SQLITE_PRAGMAS à une nouvelle connexion SQLite."""
+    cursor = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+@lru_cache(maxsize=1)
 def get_engine():
-    """Crée la connexion à la base de données."""
+    """Crée la connexion à la base de données (une seule fois : le pool est partagé)."""
     if USE_SQLITE:
         SQLITE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        return create_engine(f"sqlite:///{SQLITE_PATH}", echo=False)
-    return create_engine(POSTGRES_URI, echo=False)
+        engine = create_engine(f"sqlite:///{SQLITE_PATH}", echo=False)
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    # executemany regroupé en INSERT multi-VALUES / lots psycopg2 ; pool dimensionné pour l'API
+    return create_engine(POSTGRES_URI, echo=False, pool_pre_ping=True, pool_size=20,
+                         executemany_mode="values_plus_batch")
+
+
+# Fabrique de sessions partagée, créée au premier appel de get_session()
+_SessionLocal: Optional[sessionmaker] = None
 
 
 def get_session():
     """Crée une session SQLAlchemy."""
-    return sessionmaker(bind=get_engine())()
+    global _SessionLocal
+    if _SessionLocal is None:
+        # expire_on_commit=False : les objets restent lisibles après commit sans re-SELECT
+        # autoflush=False : pas de flush implicite avant chaque requête (chargement ensembliste)
+        _SessionLocal = sessionmaker(bind=get_engine(), autoflush=False, expire_on_commit=False)
+    return _SessionLocal()
+
+
+# Types réduits des colonnes numériques, tels que PostgreSQL les rapporte
+NARROWED_COLUMN_TYPES = {
+    'products': {'nova_group': 'SMALLINT', 'quality_score': 'SMALLINT'},
+    'nutrition_facts': {field: 'REAL' for field in NUTRITION_FIELDS},
+}
+
+
+def _migrate_column_types(conn):
+    """
+    Applique NARROWED_COLUMN_TYPES à une base PostgreSQL existante : create_all ne
+    modifie pas une table déjà créée. Sans effet sur SQLite, où le type déclaré ne
+    change pas le stockage, ni sur une base déjà à jour.
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    inspector = inspect(conn)
+    for table, expected in NARROWED_COLUMN_TYPES.items():
+        current = {c["name"]: c["type"].compile(dialect=conn.dialect) for c in inspector.get_columns(table)}
+        changes = [f"ALTER COLUMN {name} TYPE {sql_type}" for name, sql_type in expected.items()
+                   if current.get(name, sql_type) != sql_type]
+        if changes:
+            conn.execute(text(f"ALTER TABLE {table} {', '.join(changes)}"))
+
+
+# Index mono-colonne des versions précédentes (ORM index=True et schema.sql),
+# remplacés par les index composés de Product.__table_args__
+LEGACY_PRODUCT_INDEXES = (
+    'ix_products_brand_id', 'ix_products_category_id', 'ix_products_nutriscore_grade', 'ix_products_quality_score',
+    'idx_products_code', 'idx_products_brand_id', 'idx_products_category_id', 'idx_products_nutriscore',
+    'idx_products_quality',
+)
+
+
+def _migrate_indexes(conn):
+    """
+    Aligne les index de products sur le modèle dans une base existante : create_all
+    ne crée pas les index d'une table déjà présente. Les anciens index sont supprimés
+    et les index manquants créés (sans effet sur une base déjà à jour).
+    """
+    for name in LEGACY_PRODUCT_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for index in Product.__table__.indexes:
+        index.create(conn, checkfirst=True)
 
 
 def create_tables():
-    """Crée les tables dans la base de données."""
+    """Crée les tables dans la base de données (et met à jour types et index d'une base existante)."""
     engine = get_engine()
     Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        _migrate_column_types(conn)
+        _migrate_indexes(conn)
     return engine
+
+
+def _upsert(session: Session, model):
+    """INSERT ... ON CONFLICT du dialecte de la session (PostgreSQL ou SQLite)."""
+    return (pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert)(model)
+
+
+def _batched(rows: List, size: int) -> Iterator[List]:
+    """Découpe une liste en lots de `size` éléments."""
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _trunc(value, size: int) -> str:
+    """Chaîne tronquée à `size` caractères ("" si vide), sans copie si elle est déjà assez courte."""
+    s = value or ""
+    return s if len(s) <= size else s[:size]
+
+
+def _clean_name(name) -> str:
+    """Nom de marque/catégorie tel que stocké (même règle que le chargement ligne à ligne)."""
+    return _trunc(name.strip(), 255) if name else None
+
+
+def resolve_fk_ids(session: Session, names: Iterable[str], model, chunk: int = 1000) -> dict:
+    """
+    Résout des noms de marques/catégories en ids, en créant ceux qui manquent.
+    
+    Par lot : un SELECT ... WHERE name IN (...) pour les existants, un INSERT des
+    absents (ON CONFLICT DO NOTHING ... RETURNING), puis un SELECT de rattrapage pour
+    ceux insérés entre-temps par une autre transaction. Remplace le get-or-create
+    par produit (2N requêtes).
+    
+    Returns:
+        dict: {nom: id}, à réutiliser comme cache pour tout le lot
+    """
+    names = sorted(n for n in set(names) if n is not None)
+    ids = {}
+    for chunk_names in _batched(names, chunk):
+        ids.update(session.execute(select(model.name, model.id).where(model.name.in_(chunk_names))).all())
+        missing = [n for n in chunk_names if n not in ids]
+        if not missing:
+            continue
+        stmt = _upsert(session, model).on_conflict_do_nothing(index_elements=["name"]).returning(model.name, model.id)
+        ids.update(session.execute(stmt, [{"name": n} for n in missing]).all())
+        raced = [n for n in missing if n not in ids]
+        if raced:
+            ids.update(session.execute(select(model.name, model.id).where(model.name.in_(raced))).all())
+    return ids
+
+
+def bulk_insert_products(session: Session, enriched: List[dict], chunk: int = 1000) -> int:
+    """
+    Charge des documents enrichis en masse : un INSERT ... ON CONFLICT par lot de `chunk`
+    lignes pour chaque table, au lieu d'un add() + flush() par produit.
+    
+    Les produits déjà présents (même code) sont mis à jour, leurs données
+    nutritionnelles aussi. Les ids des produits reviennent par RETURNING.
+    
+    Returns:
+        int: Nombre de produits chargés
+    """
+    # Un seul enregistrement par code (le dernier l'emporte, comme en ligne à ligne)
+    rows = {}
+    for doc in enriched:
+        data = doc.get("data", {})
+        if data.get("code"):
+            rows[data["code"]] = data
+    if not rows:
+        return 0
+    
+    # Noms nettoyés une seule fois par produit, réutilisés pour la résolution et les lignes
+    names = {code: (_clean_name(d.get("brands")), _clean_name(d.get("category"))) for code, d in rows.items()}
+    brand_ids = resolve_fk_ids(session, (brand for brand, _ in names.values()), Brand, chunk)
+    category_ids = resolve_fk_ids(session, (category for _, category in names.values()), Category, chunk)
+    
+    products = []
+    for code, d in rows.items():
+        get = d.get
+        brand, category = names[code]
+        products.append({
+            "code": code,
+            "product_name": _trunc(get("product_name"), 500),
+            "brand_id": brand_ids.get(brand),
+            "category_id": category_ids.get(category),
+            "nutriscore_grade": _trunc(get("nutriscore_grade"), 1),
+            "nova_group": get("nova_group"),
+            "quality_score": get("quality_score"),
+            "image_url": _trunc(get("image_url"), 500) or None,
+        })
+    
+    product_ids = {}
+    for chunk_rows in _batched(products, chunk):
+        stmt = _upsert(session, Product)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["code"], set_={c: stmt.excluded[c] for c in PRODUCT_UPDATE_FIELDS}
+        ).returning(Product.code, Product.id)
+        product_ids.update(session.execute(stmt, chunk_rows).all())
+    
+    # Comme en ligne à ligne : une nutrition entièrement vide remet à NULL la ligne
+    # existante, mais ne crée pas de ligne
+    nutrition, cleared = [], []
+    for code, d in rows.items():
+        if not (n := d.get("nutrition")):
+            continue
+        if any(v is not None for v in n.values()):
+            nutrition.append({"product_id": product_ids[code], **{k: n.get(k) for k in NUTRITION_FIELDS}})
+        else:
+            cleared.append(product_ids[code])
+    for chunk_ids in _batched(cleared, chunk):
+        session.execute(
+            update(NutritionFacts)
+            .where(NutritionFacts.product_id.in_(chunk_ids),
+                   or_(*(getattr(NutritionFacts, k).is_not(None) for k in NUTRITION_FIELDS)))
+            .values({k: None for k in NUTRITION_FIELDS})
+        )
+    for chunk_rows in _batched(nutrition, chunk):
+        stmt = _upsert(session, NutritionFacts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["product_id"], set_={k: stmt.excluded[k] for k in NUTRITION_FIELDS},
+            # Lignes identiques (relance idempotente) : pas de réécriture
+            where=or_(*(getattr(NutritionFacts, k).is_distinct_from(stmt.excluded[k]) for k in NUTRITION_FIELDS)),
+        )
+        session.execute(stmt, chunk_rows)
+    
+    return len(rows)
@@ -1,14 +1,62 @@
 """Pipeline ETL : MongoDB → PostgreSQL."""
 
-from typing import Optional
+import threading
+from itertools import islice
+from queue import Empty, Queue
+from typing import Iterable, Iterator, List, Optional
 from loguru import logger
 from sqlalchemy.orm import Session
 
-import sys
-sys.path.insert(0, str(__file__).rsplit("src", 1)[0])
-
 from src.database.mongodb_manager import MongoDBManager
-from src.etl.models import get_session, create_tables, Product, Brand, Category, NutritionFacts
+from src.etl.models import get_session, create_tables, bulk_insert_products
+
+
+# Documents enrichis lus puis chargés par lot
+LOAD_CHUNK_SIZE = 1000
+# Seuls champs lus par bulk_insert_products : MongoDB n'envoie pas le reste du document
+ETL_PROJECTION = {"_id": 0, **{f"data.{field}": 1 for field in (
+    "code", "product_name", "brands", "category", "nutriscore_grade",
+    "nova_group", "quality_score", "image_url", "nutrition",
+)}}
+
+
+def prefetch_chunks(docs: Iterable[dict], size: int, depth: int = 2) -> Iterator[List[dict]]:
+    """
+    Lit `docs` par lots de `size` dans un thread, pendant que l'appelant traite le lot précédent.
+    
+    Le réseau MongoDB et les écritures SQL libèrent le GIL : la lecture du lot N+1
+    se recouvre avec le chargement du lot N. Au plus `depth` lots attendent en mémoire.
+    """
+    chunks = Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+    
+    def produce():
+        try:
+            docs_iter = iter(docs)
+            while chunk := list(islice(docs_iter, size)):
+                chunks.put(chunk)
+                if stop.is_set():
+                    return
+            chunks.put(end)
+        except Exception as e:
+            chunks.put(e)
+    
+    reader = threading.Thread(target=produce, daemon=True)
+    reader.start()
+    try:
+        while (chunk := chunks.get()) is not end:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # Arrêt anticipé (erreur SQL) : vider la file pour débloquer le lecteur
+        stop.set()
+        while reader.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except Empty:
+                pass
 
 
 class ETLPipeline:
@@ -16,8 +64,6 @@ class ETLPipeline:
     
     def __init__(self):
         self.session: Optional[Session] = None
-        self.brands_cache = {}
-        self.categories_cache = {}
     
     def run(self):
         """Exécute le pipeline ETL complet."""
@@ -26,108 +72,18 @@ class ETLPipeline:
         self.session = get_session()
         
         try:
-            with MongoDBManager() as mongo:
-                enriched_docs = mongo.get_enriched_documents(status="success", limit=10000)
+            loaded = 0
+            # Une seule transaction pour tout le chargement : commit à la sortie du bloc,
+            # rollback si une exception le traverse, sans flush intermédiaire
+            with self.session, self.session.begin(), MongoDBManager() as mongo:
+                # Lecture en flux, lot suivant lu pendant le chargement du lot courant
+                docs = mongo.iter_enriched_documents(status="success", limit=10000, projection=ETL_PROJECTION)
+                # Chargement ensembliste : un INSERT ... ON CONFLICT par lot et par table
+                for chunk in prefetch_chunks(docs, LOAD_CHUNK_SIZE):
+                    loaded += bulk_insert_products(self.session, chunk, chunk=LOAD_CHUNK_SIZE)
             
-            logger.info(f"📥 {len(enriched_docs)} documents extraits")
-            
-            loaded = sum(1 for doc in enriched_docs if self._load_product(doc))
-            self.session.commit()
             logger.info(f"✅ {loaded} produits chargés en SQL")
             
         except Exception as e:
-            self.session.rollback()
             logger.error(f"Erreur ETL: {e}")
             raise
-        finally:
-            self.session.close()
-    
-    def _get_or_create_brand(self, name: str) -> Optional[Brand]:
-        """Récupère ou crée une marque."""
-        if not name:
-            return None
-        name = name.strip()[:255]
-        
-        if name in self.brands_cache:
-            return self.brands_cache[name]
-        
-        brand = self.session.query(Brand).filter_by(name=name).first()
-        if not brand:
-            brand = Brand(name=name)
-            self.session.add(brand)
-            self.session.flush()
-        
-        self.brands_cache[name] = brand
-        return brand
-    
-    def _get_or_create_category(self, name: str) -> Optional[Category]:
-        """Récupère ou crée une catégorie."""
-        if not name:
-            return None
-        name = name.strip()[:255]
-        
-        if name in self.categories_cache:
-            return self.categories_cache[name]
-        
-        category = self.session.query(Category).filter_by(name=name).first()
-        if not category:
-            category = Category(name=name)
-            self.session.add(category)
-            self.session.flush()
-        
-        self.categories_cache[name] = category
-        return category
-    
-    def _load_product(self, enriched_doc: dict) -> bool:
-        """Charge un produit enrichi en SQL."""
-        data = enriched_doc.get("data", {})
-        code = data.get("code")
-        if not code:
-            return False
-        
-        existing = self.session.query(Product).filter_by(code=code).first()
-        brand = self._get_or_create_brand(data.get("brands", ""))
-        category = self._get_or_create_category(data.get("category", ""))
-        
-        if existing:
-            existing.product_name = data.get("product_name", "")[:500]
-            existing.nutriscore_grade = (data.get("nutriscore_grade") or "")[:1]
-            existing.nova_group = data.get("nova_group")
-            existing.quality_score = data.get("quality_score")
-            existing.image_url = (data.get("image_url") or "")[:500] if data.get("image_url") else None
-            existing.brand = brand
-            existing.category = category
-            self._update_nutrition(existing, data.get("nutrition", {}))
-        else:
-            product = Product(
-                code=code,
-                product_name=data.get("product_name", "")[:500],
-                brand=brand,
-                category=category,
-                nutriscore_grade=(data.get("nutriscore_grade") or "")[:1],
-                nova_group=data.get("nova_group"),
-                quality_score=data.get("quality_score"),
-                image_url=(data.get("image_url") or "")[:500] if data.get("image_url") else None
-            )
-            self.session.add(product)
-            self.session.flush()
-            self._create_nutrition(product, data.get("nutrition", {}))
-        
-        return True
-    
-    def _update_nutrition(self, product: Product, nutrition: dict):
-        """Met à jour les données nutritionnelles."""
-        if not nutrition:
-            return
-        if product.nutrition:
-            for field in ['energy_kcal', 'fat', 'saturated_fat', 'carbohydrates', 'sugars', 'fiber', 'proteins', 'salt']:
-                setattr(product.nutrition, field, nutrition.get(field))
-        else:
-            self._create_nutrition(product, nutrition)
-    
-    def _create_nutrition(self, product: Product, nutrition: dict):
-        """Crée les données nutritionnelles."""
-        if not nutrition or not any(v is not None for v in nutrition.values()):
-            return
-        facts = NutritionFacts(product_id=product.id, **{k: nutrition.get(k) for k in ['energy_kcal', 'fat', 'saturated_fat', 'carbohydrates', 'sugars', 'fiber', 'proteins', 'salt']})
-        self.session.add(facts)
@@ -11,12 +11,8 @@ et de garantir des données cohérentes.
 """
 
 import pytest
-import sys
-from pathlib import Path
 from datetime import datetime, timezone
 
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-
 
 # =============================================================================
 # FIXTURES DE DONNÉES PRODUIT
@@ -109,21 +105,29 @@ def invalid_nutriscore_document():
 # FIXTURES POUR LES TESTS API
 # =============================================================================
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def api_client():
-    """Client de test FastAPI."""
+    """Client de test FastAPI, démarré une fois par module de tests."""
     from fastapi.testclient import TestClient
     from src.api.main import app
-    return TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
 
 # =============================================================================
 # FIXTURES POUR LES TESTS SQL
 # =============================================================================
 
+@pytest.fixture(scope="session")
+def shared_engine():
+    """Moteur unique (et son pool) pour toute la session de tests, tables créées une fois."""
+    from src.etl.models import create_tables
+    return create_tables()
+
+
 @pytest.fixture
-def db_session():
-    """Session SQLAlchemy pour les tests."""
+def db_session(shared_engine):
+    """Session SQLAlchemy pour les tests, sur le moteur partagé."""
     from src.etl.models import get_session
     session = get_session()
     yield session
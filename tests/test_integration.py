@@ -10,16 +10,13 @@ fonctionnent correctement ensemble.
 """
 
 import pytest
-import sys
-from pathlib import Path
-
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 
 # =============================================================================
 # TESTS API FASTAPI
 # =============================================================================
 
+@pytest.mark.xdist_group("api")
 class TestAPIIntegration:
     """Tests d'intégration de l'API REST."""
     
@@ -44,6 +41,23 @@ class TestAPIIntegration:
         assert data["page_size"] == 5
         assert len(data["items"]) <= 5
     
+    def test_api_items_cursor_pagination(self, api_client):
+        """Test de la pagination par curseur : même ordre et mêmes pages qu'en OFFSET."""
+        first = api_client.get("/items", params={"page": 1, "page_size": 5}).json()
+        keys = [(-(item["quality_score"] if item["quality_score"] is not None else -1), item["id"]) for item in first["items"]]
+        assert keys == sorted(keys)
+        assert (first["next_cursor"] is not None) == (first["total"] > 5)
+        if first["next_cursor"] is not None:
+            response = api_client.get("/items", params={"cursor": first["next_cursor"], "page": 2, "page_size": 5})
+            assert response.status_code == 200
+            by_offset = api_client.get("/items", params={"page": 2, "page_size": 5}).json()
+            assert [i["id"] for i in response.json()["items"]] == [i["id"] for i in by_offset["items"]]
+    
+    def test_api_items_invalid_cursor(self, api_client):
+        """Un curseur mal formé est refusé."""
+        response = api_client.get("/items", params={"cursor": "abc"})
+        assert response.status_code == 422
+    
     def test_api_items_search(self, api_client):
         """Test de la recherche par mot-clé."""
         response = api_client.get("/items", params={"search": "test"})
@@ -64,6 +78,23 @@ class TestAPIIntegration:
             if item.get("nutriscore_grade"):
                 assert item["nutriscore_grade"].lower() == "a"
     
+    def test_api_items_filter_multiple_nutriscores(self, api_client):
+        """Test du filtre sur plusieurs Nutriscores (liste séparée par des virgules)."""
+        response = api_client.get("/items", params={"nutriscore": "a,b"})
+        
+        assert response.status_code == 200
+        for item in response.json()["items"]:
+            assert item["nutriscore_grade"].lower() in ["a", "b"]
+    
+    def test_api_items_filter_nutriscore_include_ungraded(self, api_client):
+        """Avec include_ungraded, les produits sans Nutriscore sont conservés (casse ignorée)."""
+        strict = api_client.get("/items", params={"nutriscore": "A,B"}).json()
+        loose = api_client.get("/items", params={"nutriscore": "A,B", "include_ungraded": True}).json()
+        
+        assert loose["total"] >= strict["total"]
+        for item in loose["items"]:
+            assert not item["nutriscore_grade"] or item["nutriscore_grade"].lower() in ["a", "b"]
+    
     def test_api_stats_endpoint(self, api_client):
         """Test de l'endpoint /stats."""
         response = api_client.get("/stats")
@@ -149,6 +180,7 @@ class TestAPIIntegration:
 # TESTS INTÉGRATION SQL
 # =============================================================================
 
+@pytest.mark.xdist_group("sql")
 class TestSQLIntegration:
     """Tests d'intégration avec SQLite/PostgreSQL."""
     
@@ -159,20 +191,31 @@ class TestSQLIntegration:
         engine = create_tables()
         assert engine is not None
     
+    def test_create_tables_migrates_indexes(self):
+        """Les anciens index mono-colonne disparaissent, les index composés existent."""
+        from sqlalchemy import inspect
+        from src.etl.models import create_tables, LEGACY_PRODUCT_INDEXES
+        
+        names = {index["name"] for index in inspect(create_tables()).get_indexes("products")}
+        assert {"idx_brand", "idx_cat_quality", "idx_nutriscore_quality"} <= names
+        assert not names & set(LEGACY_PRODUCT_INDEXES)
+    
     def test_sql_session(self, db_session):
         """Test de connexion et requête simple."""
         from src.etl.models import Product
+        from sqlalchemy import select, func
         
-        count = db_session.query(Product).count()
+        count = db_session.execute(select(func.count()).select_from(Product)).scalar_one()
         assert count >= 0
     
     def test_sql_query_with_filter(self, db_session):
         """Test de requête avec filtre."""
         from src.etl.models import Product
+        from sqlalchemy import select, bindparam
         
-        products = db_session.query(Product).filter(
-            Product.nutriscore_grade == "a"
-        ).limit(5).all()
+        # Paramètre lié : même SQL compilé (cache SQLAlchemy) quelle que soit la valeur
+        stmt = select(Product).where(Product.nutriscore_grade == bindparam("grade")).limit(5)
+        products = db_session.execute(stmt, {"grade": "a"}).scalars().all()
         
         assert isinstance(products, list)
         for p in products:
@@ -181,24 +224,26 @@ class TestSQLIntegration:
     def test_sql_relationships_brand(self, db_session):
         """Test de la relation Product -> Brand."""
         from src.etl.models import Product, Brand
+        from sqlalchemy import select
         
-        product = db_session.query(Product).filter(
-            Product.brand_id.isnot(None)
+        row = db_session.execute(
+            select(Product.id, Product.brand_id).where(Product.brand_id.isnot(None)).limit(1)
         ).first()
         
-        if product:
-            assert product.brand is not None or product.brand_id is not None
+        if row:
+            assert db_session.get(Brand, row.brand_id) is not None
     
     def test_sql_relationships_category(self, db_session):
         """Test de la relation Product -> Category."""
         from src.etl.models import Product, Category
+        from sqlalchemy import select
         
-        product = db_session.query(Product).filter(
-            Product.category_id.isnot(None)
+        row = db_session.execute(
+            select(Product.id, Product.category_id).where(Product.category_id.isnot(None)).limit(1)
         ).first()
         
-        if product:
-            assert product.category is not None or product.category_id is not None
+        if row:
+            assert db_session.get(Category, row.category_id) is not None
     
     def test_sql_query_aggregate(self, db_session):
         """Test des fonctions d'agrégation."""
@@ -223,6 +268,71 @@ class TestSQLIntegration:
         ).group_by(Product.nutriscore_grade).all()
         
         assert isinstance(results, list)
+    
+    def test_bulk_insert_products_upsert(self, db_session):
+        """Le chargement en masse insère puis met à jour un produit (même code)."""
+        from src.etl.models import bulk_insert_products, Product
+        
+        doc = {"data": {
+            "code": "TEST_BULK_0001", "product_name": "Produit Bulk", "brands": "MarqueBulk",
+            "category": "Catégorie Bulk", "nutriscore_grade": "a", "quality_score": 90,
+            "nutrition": {"fat": 1.0}
+        }}
+        try:
+            assert bulk_insert_products(db_session, [doc]) == 1
+            doc["data"]["quality_score"] = 95
+            assert bulk_insert_products(db_session, [doc]) == 1
+            
+            product = db_session.query(Product).filter_by(code="TEST_BULK_0001").one()
+            assert product.quality_score == 95
+            assert product.brand.name == "MarqueBulk"
+            assert product.nutrition.fat == 1.0
+        finally:
+            db_session.rollback()
+    
+    def test_bulk_insert_products_clears_nutrition(self, db_session):
+        """Une nutrition rechargée entièrement vide remet la ligne existante à NULL, sans en créer."""
+        from src.etl.models import bulk_insert_products, Product
+        
+        empty = {k: None for k in ("energy_kcal", "fat", "saturated_fat", "carbohydrates", "sugars", "fiber", "proteins", "salt")}
+        doc = {"data": {"code": "TEST_BULK_0002", "product_name": "Produit Bulk 2", "nutrition": {"fat": 2.0, "salt": 0.1}}}
+        new = {"data": {"code": "TEST_BULK_0003", "product_name": "Produit Bulk 3", "nutrition": dict(empty)}}
+        try:
+            bulk_insert_products(db_session, [doc])
+            doc["data"]["nutrition"] = dict(empty)
+            bulk_insert_products(db_session, [doc, new])
+            db_session.expire_all()
+            
+            product = db_session.query(Product).filter_by(code="TEST_BULK_0002").one()
+            assert product.nutrition.fat is None
+            assert product.nutrition.salt is None
+            assert db_session.query(Product).filter_by(code="TEST_BULK_0003").one().nutrition is None
+        finally:
+            db_session.rollback()
+    
+    @pytest.mark.slow
+    def test_bulk_insert_speed(self, benchmark, db_session):
+        """Mesure du chargement ensembliste de 1000 produits (pytest-benchmark, annulé à chaque tour)."""
+        from src.etl.models import bulk_insert_products
+        
+        if benchmark.disabled:
+            pytest.skip("benchmarks désactivés (--benchmark-disable ou xdist)")
+        
+        docs = [{"data": {
+            "code": f"TEST_SPEED_{i:05d}", "product_name": f"Produit {i}", "brands": f"Marque {i % 50}",
+            "category": f"Catégorie {i % 20}", "nutriscore_grade": "abcde"[i % 5], "quality_score": i % 101,
+            "nutrition": {"fat": float(i % 30), "salt": 0.5}
+        }} for i in range(1000)]
+        
+        def load():
+            try:
+                return bulk_insert_products(db_session, docs)
+            finally:
+                db_session.rollback()
+        
+        # Pas de seuil absolu (dépend de la machine) : les régressions se suivent avec
+        # --benchmark-autosave / --benchmark-compare-fail=mean:25%
+        assert benchmark.pedantic(load, rounds=5, iterations=1, warmup_rounds=1) == 1000
 
 
 # =============================================================================
@@ -234,7 +344,7 @@ class TestPipelineIntegration:
     
     def test_enrichment_pipeline(self, sample_raw_document):
         """Test du pipeline d'enrichissement sur plusieurs documents."""
-        from src.enrichment.enricher import enrich_product
+        from src.enrichment.enricher import enrich_products
         
         raw_docs = [
             sample_raw_document,
@@ -253,7 +363,7 @@ class TestPipelineIntegration:
             }
         ]
         
-        enriched_docs = [enrich_product(doc) for doc in raw_docs]
+        enriched_docs = enrich_products(raw_docs)
         
         assert len(enriched_docs) == 2
         assert all(doc["status"] == "success" for doc in enriched_docs)
@@ -279,13 +389,25 @@ class TestPipelineIntegration:
     
     def test_pipeline_handles_batch(self, sample_raw_document, complete_raw_document):
         """Test du traitement par lot."""
-        from src.enrichment.enricher import enrich_product
+        from collections import Counter
+        from operator import itemgetter
+        from src.enrichment.enricher import enrich_products
         
         batch = [sample_raw_document, complete_raw_document]
-        results = [enrich_product(doc) for doc in batch]
+        results = enrich_products(batch)
         
-        success_count = sum(1 for r in results if r["status"] == "success")
-        assert success_count == len(batch)
+        statuses = Counter(map(itemgetter("status"), results))
+        assert statuses["success"] == len(batch)
+    
+    def test_pipeline_parallel_batch_matches_sequential(self, sample_raw_document, complete_raw_document):
+        """L'enrichissement parallèle rend les mêmes résultats, dans le même ordre."""
+        from src.enrichment.enricher import enrich_batch, enrich_product
+        
+        batch = [sample_raw_document, complete_raw_document]
+        now_iso = "2026-01-01T00:00:00Z"
+        results = [record.to_document() for record in enrich_batch(batch, workers=2, now_iso=now_iso)]
+        
+        assert results == [enrich_product(doc, now_iso=now_iso) for doc in batch]
     
     def test_pipeline_idempotent(self, sample_raw_document):
         """L'enrichissement doit être idempotent (même résultat si relancé)."""
@@ -303,29 +425,37 @@ class TestPipelineIntegration:
 # TESTS DE PERFORMANCE
 # =============================================================================
 
+@pytest.mark.slow
+@pytest.mark.xdist_group("perf")
 class TestPerformance:
     """Tests de performance basiques."""
     
-    def test_enrichment_speed(self, sample_raw_document):
-        """L'enrichissement doit être rapide."""
-        import time
-        from src.enrichment.enricher import enrich_product
+    def test_enrichment_speed(self, benchmark, sample_raw_document):
+        """L'enrichissement doit être rapide (mesure pytest-benchmark, hors import et échauffement)."""
+        from src.enrichment.enricher import enrich_products
+        
+        # --benchmark-disable (ou xdist) : pedantic n'exécute qu'une fois, sans statistiques
+        if benchmark.disabled:
+            pytest.skip("benchmarks désactivés (--benchmark-disable ou xdist)")
         
-        start = time.time()
-        for _ in range(100):
-            enrich_product(sample_raw_document)
-        duration = time.time() - start
+        docs = [sample_raw_document] * 100
+        benchmark.pedantic(enrich_products, args=(docs,), rounds=20, iterations=1, warmup_rounds=1)
         
-        # 100 enrichissements en moins de 1 seconde
-        assert duration < 1.0, f"Trop lent : {duration:.2f}s pour 100 enrichissements"
+        # 100 enrichissements en moins de 1 seconde (en moyenne)
+        mean = benchmark.stats.stats.mean
+        assert mean < 1.0, f"Trop lent : {mean:.2f}s pour 100 enrichissements"
     
-    def test_api_response_time(self, api_client):
-        """L'API doit répondre rapidement."""
+    @pytest.mark.asyncio
+    async def test_api_response_time(self):
+        """L'API doit répondre rapidement (appel ASGI direct, sans socket ni thread client)."""
         import time
+        from httpx import AsyncClient, ASGITransport
+        from src.api.main import app
         
-        start = time.time()
-        response = api_client.get("/items", params={"page_size": 10})
-        duration = time.time() - start
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            start = time.perf_counter()
+            response = await client.get("/items", params={"page_size": 10})
+            duration = time.perf_counter() - start
         
         assert response.status_code == 200
         # Réponse en moins de 500ms
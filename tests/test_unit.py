@@ -9,10 +9,6 @@ Ces tests vérifient que chaque composant fonctionne correctement en isolation.
 """
 
 import pytest
-import sys
-from pathlib import Path
-
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 
 # =============================================================================
@@ -133,6 +129,22 @@ class TestEnrichment:
         
         assert timestamp.endswith("Z")
         assert "T" in timestamp
+    
+    def test_enrich_products_matches_single(self, sample_raw_document):
+        """L'enrichissement par lot garde les nutriments tels quels (int, chaîne), comme par document."""
+        from src.enrichment.enricher import enrich_product, enrich_products
+        
+        docs = [
+            sample_raw_document,
+            {"_id": "int", "payload": {"code": "1", "nutriments": {"fat_100g": 5, "sugars_100g": 0}}},
+            {"_id": "str", "payload": {"code": "2", "nutriments": {"salt_100g": "12", "proteins_100g": 1.5}}},
+        ]
+        now_iso = "2026-01-01T00:00:00.000Z"
+        
+        results = enrich_products(docs, now_iso=now_iso)
+        assert results == [enrich_product(doc, now_iso=now_iso) for doc in docs]
+        assert results[1]["data"]["nutrition"]["fat"] == 5
+        assert results[2]["data"]["nutrition"]["salt"] == "12"
 
 
 # =============================================================================
@@ -175,6 +187,19 @@ class TestNormalization:
             result = _categorize_product(payload)
             assert result == expected, f"Failed for {payload}"
     
+    def test_categorize_batch_matches_single(self):
+        """La catégorisation vectorisée donne les mêmes catégories que par document."""
+        from src.enrichment.enricher import _categorize_product, categorize_products_batch
+        
+        payloads = [
+            {"main_category": "en:breakfast-cereals"},
+            {"main_category": "", "categories_tags": ["en:plant-based-foods", "en:snacks"]},
+            {"main_category": "fr:en:produits-laitiers"},
+            {"categories_tags": []},
+            {},
+        ]
+        assert categorize_products_batch(payloads) == [_categorize_product(p) for p in payloads]
+    
     def test_normalize_category_with_prefix(self):
         """Vérifie que le préfixe 'en:' est bien supprimé."""
         from src.enrichment.enricher import _categorize_product
@@ -227,21 +252,38 @@ class TestQualityScore:
         
         assert score_high >= score_low
     
-    @pytest.mark.parametrize("nutriscore,min_expected", [
-        ("a", 80),
-        ("b", 60),
-        ("c", 45),
-        ("d", 30),
-        ("e", 15),
-    ])
-    def test_quality_score_by_nutriscore(self, nutriscore, min_expected):
-        """Test paramétré du score par Nutriscore."""
+    def test_quality_score_by_nutriscore(self):
+        """Score minimal attendu par Nutriscore (table de cas, un seul test)."""
         from src.enrichment.enricher import _calculate_quality_score
         
-        payload = {"nutriscore_grade": nutriscore, "completeness": 0.8}
-        score = _calculate_quality_score(payload)
+        cases = [("a", 80), ("b", 60), ("c", 45), ("d", 30), ("e", 15)]
+        for nutriscore, min_expected in cases:
+            payload = {"nutriscore_grade": nutriscore, "completeness": 0.8}
+            assert _calculate_quality_score(payload) >= min_expected, nutriscore
+    
+    def test_quality_scores_batch_matches_single(self):
+        """Le calcul vectorisé donne les mêmes scores que le calcul unitaire."""
+        from src.enrichment.enricher import _calculate_quality_score, calculate_quality_scores_batch
+        
+        payloads = [
+            {"nutriscore_grade": "a", "completeness": 1.0},
+            {"nutriscore_grade": "C", "completeness": 0.37},
+            {"nutriscore_grade": None, "completeness": None},
+            {},
+        ]
+        assert calculate_quality_scores_batch(payloads) == [_calculate_quality_score(p) for p in payloads]
+    
+    def test_quality_scores_batch_atypical_completeness(self):
+        """Complétude non numérique ou NaN : mêmes résultats et mêmes erreurs que par document."""
+        from src.enrichment.enricher import _calculate_quality_score, calculate_quality_scores_batch
         
-        assert score >= min_expected
+        payloads = [{"nutriscore_grade": "b", "completeness": float("nan")}, {"nutriscore_grade": "a", "completeness": 0.5}]
+        assert calculate_quality_scores_batch(payloads) == [_calculate_quality_score(p) for p in payloads]
+        
+        with pytest.raises(TypeError):
+            _calculate_quality_score({"completeness": "0.8"})
+        with pytest.raises(TypeError):
+            calculate_quality_scores_batch([{"completeness": "0.8"}])
 
 
 # =============================================================================
@@ -290,6 +332,36 @@ class TestMappingETL:
         hashes = [compute_raw_hash(payload) for _ in range(5)]
         assert len(set(hashes)) == 1  # Tous identiques
     
+    def test_raw_hashes_batch_deterministic(self):
+        """Le hachage par lot donne un hash identique pour des payloads identiques."""
+        from src.database.mongodb_manager import compute_raw_hashes
+        
+        hashes = compute_raw_hashes([{"code": "123", "data": {"nested": "value"}}] * 5)
+        assert len(hashes) == 5
+        assert len(set(hashes)) == 1
+    
+    def test_trim_payload_keeps_enrichment_fields(self):
+        """Seuls les champs utiles à l'enrichissement sont conservés."""
+        from src.database.mongodb_manager import trim_payload
+        
+        payload = {"code": "123", "product_name": "Test", "nutriments": {}, "ingredients_text": "..."}
+        assert trim_payload(payload) == {"code": "123", "product_name": "Test", "nutriments": {}}
+    
+    def test_raw_hashes_batch_matches_single(self):
+        """Le hachage par lot donne les mêmes hash, dans le même ordre."""
+        from src.database.mongodb_manager import compute_raw_hash, compute_raw_hashes
+        
+        payloads = [{"code": str(i), "name": f"Produit {i}"} for i in range(10)]
+        assert compute_raw_hashes(payloads) == [compute_raw_hash(p) for p in payloads]
+    
+    def test_prefetch_chunks_keeps_order(self):
+        """La lecture anticipée rend tous les documents, par lots, dans l'ordre."""
+        from src.etl.pipeline import prefetch_chunks
+        
+        chunks = list(prefetch_chunks(({"i": i} for i in range(25)), 10))
+        assert [len(c) for c in chunks] == [10, 10, 5]
+        assert [d["i"] for c in chunks for d in c] == list(range(25))
+    
     def test_mapping_handles_missing_fields(self):
         """Test de mapping avec champs manquants."""
         from src.enrichment.enricher import enrich_product